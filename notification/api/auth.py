@@ -88,8 +88,8 @@ async def register_user(
         )
     
     # Create new user
-    from services.auth import get_password_hash
-    hashed_password = get_password_hash(password)
+    from services.auth import get_password_hash_async
+    hashed_password = await get_password_hash_async(password)
     
     user = User(
         username=username,
@@ -1,9 +1,16 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status
+from typing import List, Optional, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status, Response
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from models import get_customer, get_task
 from services.auth import get_current_active_user
-from tasks.import_customers import import_customers_task
+from utils.pagination import KEYSET_SORT, keyset_query, set_next_cursor
+from utils.raw_reads import find_raw
+from utils.uploads import copy_upload, UploadTooLarge
+from utils.validators import normalize_email
+from utils.file_formats import detect_file_format, FILE_EXTENSIONS
+from tasks.import_customers import import_customers_task, IMPORT_MODES
+from umongo import ValidationError
 
 from bson import ObjectId
 
@@ -24,6 +31,24 @@ class CustomerResponse(BaseModel):
     phone: Optional[str]
     company: Optional[str]
     is_active: bool
+    
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any]) -> "CustomerResponse":
+        """Build from a raw customer document projected with CUSTOMER_PROJECTION."""
+        return cls(
+            id=str(doc["_id"]),
+            email=doc["email"],
+            full_name=doc["full_name"],
+            phone=doc.get("phone"),
+            company=doc.get("company"),
+            is_active=doc.get("is_active", True)
+        )
+
+
+# Fields read by the raw customer queries
+CUSTOMER_PROJECTION = {
+    "email": 1, "full_name": 1, "phone": 1, "company": 1, "is_active": 1, "created_at": 1
+}
 
 
 @router.post("/", response_model=CustomerResponse)
@@ -33,15 +58,17 @@ async def create_customer(
 ):
     """Create a new customer."""
     Customer = get_customer()
+    # Stored lowercased like imported customers so email lookups match
+    email = normalize_email(customer_data.email)
     
-    existing_customer = await Customer.find_one({"email": customer_data.email})
+    existing_customer = await Customer.find_one({"email": email})
     if existing_customer:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Customer with this email already exists"
         )
     
-    customer = Customer(**customer_data.dict())
+    customer = Customer(**{**customer_data.dict(), "email": email})
     await customer.commit()
     
     return CustomerResponse(
@@ -56,25 +83,34 @@ async def create_customer(
 
 @router.get("/", response_model=List[CustomerResponse])
 async def list_customers(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    after: Optional[str] = None,
     current_user = Depends(get_current_active_user)
 ):
-    """List customers with pagination."""
+    """
+    List customers with pagination.
+    
+    Pass the X-Next-Cursor response header back as `after` to fetch the next
+    page with an index seek; `skip` keeps working for older clients.
+    """
     Customer = get_customer()
-    customers = await Customer.find().skip(skip).limit(limit).to_list(length=limit)
-    
-    return [
-        CustomerResponse(
-            id=str(c.id),
-            email=c.email,
-            full_name=c.full_name,
-            phone=c.phone,
-            company=c.company,
-            is_active=c.is_active
+    query = {}
+    try:
+        query = keyset_query(query, after)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
-        for c in customers
-    ]
+    
+    customers = await find_raw(
+        Customer, query, CUSTOMER_PROJECTION, sort=KEYSET_SORT, skip=skip, limit=limit
+    )
+    set_next_cursor(response, customers, limit)
+    
+    return [CustomerResponse.from_doc(c) for c in customers]
 
 
 @router.get("/{customer_id}", response_model=CustomerResponse)
@@ -85,74 +121,137 @@ async def get_customer_by_id(
     """Get customer by ID."""
     Customer = get_customer()
     obj_id = ObjectId(customer_id)
-    customer = await Customer.find_one({"_id": obj_id})
+    customer = await Customer.collection.find_one({"_id": obj_id}, CUSTOMER_PROJECTION)
     if not customer:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Customer not found"
         )
     
-    return CustomerResponse(
-        id=str(customer.id),
-        email=customer.email,
-        full_name=customer.full_name,
-        phone=customer.phone,
-        company=customer.company,
-        is_active=customer.is_active
-    )
+    return CustomerResponse.from_doc(customer)
 
 
 @router.post("/import")
 async def import_customers(
     file: UploadFile = File(...),
+    import_mode: str = "stream",
+    dry_run: bool = False,
+    force: bool = False,
     current_user = Depends(get_current_active_user)
 ):
-    """Import customers from CSV file using TaskIQ."""
-    if not file.filename.endswith('.csv'):
+    """
+    Import customers from a CSV, gzip/zstd-compressed CSV or Parquet file using TaskIQ.
+    
+    The format is detected from the file's magic bytes, not its name. The
+    upload is copied to disk in chunks off the event loop while its size
+    is checked and its sha256 computed. A file identical to one already
+    queued or imported is skipped unless `force` is set; merges and dry runs
+    may always be repeated.
+    
+    `import_mode` "merge" upserts rows keyed on email instead of skipping
+    existing customers; rows unchanged since the last merge are not written.
+    "parallel" parses plain CSV files in byte ranges across worker processes.
+    
+    With `dry_run` nothing is written: the file is validated as `import_mode`
+    would import it and a rejection report, counts by reason plus sample
+    rows, is stored in the task result.
+    """
+    if import_mode not in IMPORT_MODES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Only CSV files are supported"
+            detail=f"import_mode must be one of {list(IMPORT_MODES)}"
         )
     
     # Save file temporarily
     import os
     from config.settings import settings
     
+    if file.size is not None and file.size > settings.max_file_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File exceeds the maximum size of {settings.max_file_size} bytes"
+        )
+    
     # Ensure upload directory exists
     os.makedirs(settings.upload_dir, exist_ok=True)
     
-    # Generate unique filename
+    # Generate unique filename, renamed after the detected format below
     import uuid
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = os.path.join(settings.upload_dir, unique_filename)
+    file_path = os.path.join(settings.upload_dir, str(uuid.uuid4()))
     
     # Save uploaded file
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
+    try:
+        file_size, content_hash = await run_in_threadpool(
+            copy_upload, file.file, file_path, settings.max_file_size
+        )
+    except UploadTooLarge as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    
+    file_format = detect_file_format(file_path)
+    if file_format is None:
+        os.remove(file_path)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only CSV, gzip/zstd-compressed CSV and Parquet files are supported"
+        )
+    stored_path = file_path + FILE_EXTENSIONS[file_format]
+    os.rename(file_path, stored_path)
+    file_path = stored_path
     
-        
-    # Start background task
-    result = await import_customers_task.kiq(
-        file_path=file_path,
-        user_id=str(current_user.id)
-    )
-
-    job_id = result.task_id
-
     Task = get_task()
+    job_id = uuid.uuid4().hex
     task = Task(
         job_id=job_id,
         task_name="import_customers",
         status="pending",
         user_id=str(current_user.id),
-        parameters={"file_path": file_path, "original_filename": file.filename}
+        parameters={
+            "file_path": file_path,
+            "original_filename": file.filename,
+            "import_mode": import_mode,
+            "dry_run": dry_run,
+            "file_format": file_format,
+            "file_size": file_size,
+            "content_hash": content_hash
+        }
     )
-    await task.commit()
+    # Merges are meant to be re-run with the same file and dry runs write nothing
+    if not force and not dry_run and import_mode != "merge":
+        task.dedupe_key = content_hash
+    
+    # The unique dedupe_key index makes the record the lock against concurrent
+    # identical uploads, so it is written before the task is kicked
+    try:
+        await task.commit()
+    except ValidationError as e:
+        if "dedupe_key" not in e.messages:
+            raise
+        os.remove(file_path)
+        existing = await Task.collection.find_one({"dedupe_key": content_hash}, {"job_id": 1})
+        return {
+            "message": "Identical file was already imported",
+            "job_id": existing["job_id"] if existing else None,
+            "file_name": file.filename,
+            "status": "duplicate"
+        }
+    
+    # Start background task
+    try:
+        await import_customers_task.kicker().with_task_id(job_id).kiq(
+            file_path=file_path,
+            user_id=str(current_user.id),
+            import_mode=import_mode,
+            dry_run=dry_run
+        )
+    except Exception:
+        await task.delete()
+        raise
     
     return {
-        "message": "CSV import started",
+        "message": "Customer import started",
         "job_id": task.job_id,
         "task_id": str(task.id),
         "file_name": file.filename,
@@ -1,10 +1,17 @@
-from typing import List, Optional
+from typing import List, Optional, Dict, Any, Tuple
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from models import get_user, get_customer, get_chat, get_message
+from umongo import ValidationError
+from models import get_customer, get_chat, get_message
 from services.auth import get_current_active_user
 from services.ai_chatbot import ai_chatbot
 from services.memory_manager import memory_manager
+from services.context_cache import context_cache
+from services.report_counters import report_counters
+from utils.raw_reads import find_raw
+from utils.sse import format_sse, SSE_HEADERS
 
 from bson import ObjectId
 
@@ -27,6 +34,25 @@ class MessageResponse(BaseModel):
     message_type: str
     created_at: str
     metadata: Optional[dict] = None
+    
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any]) -> "MessageResponse":
+        """Build from a raw message document projected with MESSAGE_PROJECTION."""
+        return cls(
+            id=str(doc["_id"]),
+            content=doc["content"],
+            role=doc["role"],
+            message_type=doc["message_type"],
+            created_at=doc["created_at"].isoformat(),
+            metadata=doc.get("metadata", {})
+        )
+
+
+# Fields read by the raw history queries
+MESSAGE_PROJECTION = {
+    "content": 1, "role": 1, "message_type": 1, "created_at": 1, "metadata": 1
+}
+NOTIFICATION_CONTEXT_PROJECTION = {"content": 1, "created_at": 1, "metadata": 1}
 
 
 class ChatResponse(BaseModel):
@@ -35,65 +61,63 @@ class ChatResponse(BaseModel):
     messages: List[MessageResponse]
 
 
-@router.post("/send", response_model=MessageResponse)
-async def send_message(
-    message_data: MessageRequest,
-    current_user = Depends(get_current_active_user)
-):
-    """Send message to AI chatbot and get response."""
-    Customer = get_customer()
+async def start_chat_turn(message_data: MessageRequest) -> Tuple[Dict[str, Any], str]:
+    """Load the chat context, ensure an active chat session and save the user message."""
     Chat = get_chat()
     Message = get_message()
     
-    # Get or create chat session
-    customer = await Customer.find_one({"_id": ObjectId(message_data.customer_id)})
-    if not customer:
+    # Profile, chat session and recent memory come from the context cache
+    context = await context_cache.get_context(message_data.customer_id)
+    if not context:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Customer not found"
         )
     
-    # Get active chat session or create new one
-    chat = await Chat.find_one({
-        "customer": ObjectId(message_data.customer_id),
-        "is_active": True
-    })
-    
-    if not chat:
+    # Create a chat session if the customer has no active one
+    chat_id = context["chat_id"]
+    if not chat_id:
         chat = Chat(
             customer=ObjectId(message_data.customer_id),
             session_id=str(uuid.uuid4()),
             is_active=True
         )
-        await chat.commit()
+        try:
+            await chat.commit()
+            chat_id = str(chat.id)
+        except ValidationError:
+            # Another request created the active session first
+            chat = await Chat.find_one({"customer": ObjectId(message_data.customer_id), "is_active": True})
+            chat_id = str(chat.id)
     
     # Save user message to database
     user_message = Message(
-        chat=str(chat.id),
+        chat=chat_id,
         customer=ObjectId(message_data.customer_id),
         content=message_data.content,
         role="user",
         message_type="user"
     )
     await user_message.commit()
+    await report_counters.record_messages("user", [message_data.customer_id])
     
-    # Get customer info for context
-    customer_info = {
-        "full_name": customer.full_name,
-        "email": customer.email,
-        "company": customer.company
-    }
-    
-    # Generate AI response
-    ai_response_data = await ai_chatbot.generate_response(
-        customer_id=message_data.customer_id,
-        message=message_data.content,
-        customer_info=customer_info
-    )
+    return context, chat_id
+
+
+async def save_ai_response(
+    message_data: MessageRequest,
+    chat_id: str,
+    ai_response_data: Dict[str, Any],
+    message_id: Optional[ObjectId] = None
+):
+    """Save the AI response message and update short-term memory."""
+    if "content" not in ai_response_data:
+        # The stream was aborted before the model finished
+        return None
     
-    # Save AI response to database
+    Message = get_message()
     ai_message = Message(
-        chat=str(chat.id),
+        chat=chat_id,
         customer=ObjectId(message_data.customer_id),
         content=ai_response_data["content"],
         role="assistant",
@@ -102,7 +126,10 @@ async def send_message(
         response_time=ai_response_data.get("response_time"),
         metadata=ai_response_data.get("metadata", {})
     )
+    if message_id:
+        ai_message.id = message_id
     await ai_message.commit()
+    await report_counters.record_messages("ai", [message_data.customer_id])
     
     # Update memory
     await ai_chatbot.update_memory(
@@ -110,6 +137,27 @@ async def send_message(
         user_message=message_data.content,
         ai_response=ai_response_data
     )
+    return ai_message
+
+
+@router.post("/send", response_model=MessageResponse)
+async def send_message(
+    message_data: MessageRequest,
+    current_user = Depends(get_current_active_user)
+):
+    """Send message to AI chatbot and get response."""
+    context, chat_id = await start_chat_turn(message_data)
+    
+    # Generate AI response
+    ai_response_data = await ai_chatbot.generate_response(
+        customer_id=message_data.customer_id,
+        message=message_data.content,
+        customer_info=context["profile"],
+        context=context
+    )
+    
+    # Save AI response to database
+    ai_message = await save_ai_response(message_data, chat_id, ai_response_data)
     
     return MessageResponse(
         id=str(ai_message.id),
@@ -120,6 +168,48 @@ async def send_message(
     )
 
 
+@router.post("/send/stream")
+async def send_message_stream(
+    message_data: MessageRequest,
+    current_user = Depends(get_current_active_user)
+):
+    """
+    Send message to AI chatbot and stream the response as server-sent events.
+    
+    Emits "token" events as the model produces text and a final "done" event.
+    The AI message and short-term memory are saved in a background step
+    after the stream ends.
+    """
+    context, chat_id = await start_chat_turn(message_data)
+    
+    ai_message_id = ObjectId()
+    ai_response_data = {}
+    
+    async def event_stream():
+        async for token in ai_chatbot.stream_response(
+            customer_id=message_data.customer_id,
+            message=message_data.content,
+            result=ai_response_data,
+            customer_info=context["profile"],
+            context=context
+        ):
+            yield format_sse({"type": "token", "content": token})
+        yield format_sse({
+            "type": "done",
+            "id": str(ai_message_id),
+            "response_time": ai_response_data.get("response_time")
+        })
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+        background=BackgroundTask(
+            save_ai_response, message_data, chat_id, ai_response_data, ai_message_id
+        )
+    )
+
+
 @router.get("/history")
 async def get_message_history(
     customer_id: str,
@@ -131,7 +221,7 @@ async def get_message_history(
     Customer = get_customer()
     Message = get_message()
     
-    customer = await Customer.find_one({"_id": ObjectId(customer_id)})
+    customer = await Customer.collection.find_one({"_id": ObjectId(customer_id)}, {"_id": 1})
     if not customer:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -142,19 +232,11 @@ async def get_message_history(
     if message_type:
         query["message_type"] = message_type
     
-    messages = await Message.find(query).sort("created_at", -1).limit(limit).to_list(length=limit)
+    messages = await find_raw(
+        Message, query, MESSAGE_PROJECTION, sort=[("created_at", -1)], limit=limit
+    )
     
-    return [
-        MessageResponse(
-            id=str(msg.id),
-            content=msg.content,
-            role=msg.role,
-            message_type=msg.message_type,
-            created_at=msg.created_at.isoformat(),
-            metadata=msg.metadata
-        )
-        for msg in reversed(messages)  # Oldest first
-    ]
+    return [MessageResponse.from_doc(msg) for msg in reversed(messages)]  # Oldest first
 
 
 @router.get("/memory/stats")
@@ -177,7 +259,7 @@ async def get_notification_context(
     Customer = get_customer()
     Message = get_message()
     
-    customer = await Customer.find_one({"_id": ObjectId(customer_id)})
+    customer = await Customer.collection.find_one({"_id": ObjectId(customer_id)}, {"_id": 1})
     if not customer:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -185,17 +267,20 @@ async def get_notification_context(
         )
     
     # Get recent system notifications
-    notifications = await Message.find({
-        "customer": ObjectId(customer_id),
-        "message_type": "system"
-    }).sort("created_at", -1).limit(limit).to_list(length=limit)
+    notifications = await find_raw(
+        Message,
+        {"customer": ObjectId(customer_id), "message_type": "system"},
+        NOTIFICATION_CONTEXT_PROJECTION,
+        sort=[("created_at", -1)],
+        limit=limit
+    )
     
     return [
         {
-            "id": str(notif.id),
-            "content": notif.content,
-            "created_at": notif.created_at.isoformat(),
-            "metadata": notif.metadata
+            "id": str(notif["_id"]),
+            "content": notif["content"],
+            "created_at": notif["created_at"].isoformat(),
+            "metadata": notif.get("metadata", {})
         }
         for notif in notifications
     ] 
\ No newline at end of file
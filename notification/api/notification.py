@@ -1,14 +1,18 @@
-from typing import List, Optional, Union
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from typing import List, Optional, Union, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Response
 from pydantic import BaseModel
 import uuid
 import os
-from datetime import datetime
+from datetime import datetime, UTC
 
 from models import get_user, get_customer, get_notification_config, get_message, get_task
 from services.auth import get_current_active_user
-from tasks.send_notification import send_notification_task
+from utils.pagination import KEYSET_SORT, keyset_query, set_next_cursor
+from utils.raw_reads import find_raw
+from tasks.send_notification import send_notification_task, SEND_MODES
 from config.settings import settings
+from utils.templates import compile_template
+from services.report_counters import report_counters, report_date, DAY_SCOPE_KEY
 
 from bson import ObjectId
 
@@ -43,6 +47,7 @@ class NotificationSendRequest(BaseModel):
     notification_config_id: str
     data: dict = {}  # Dynamic data for template
     notification_type: str = "chat"  # chat, email, or both
+    send_mode: str = "batch"  # batch, single
 
 
 class NotificationResponse(BaseModel):
@@ -54,6 +59,27 @@ class NotificationResponse(BaseModel):
     role: str
     created_at: str
     metadata: Optional[dict] = None
+    
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any]) -> "NotificationResponse":
+        """Build from a raw message document projected with NOTIFICATION_PROJECTION."""
+        metadata = doc.get("metadata", {})
+        return cls(
+            id=str(doc["_id"]),
+            customer_id=str(doc["customer"]),
+            config_id=metadata.get("notification_config_id", "") if metadata else "",
+            content=doc["content"],
+            message_type=doc["message_type"],
+            role=doc["role"],
+            created_at=doc["created_at"].isoformat(),
+            metadata=metadata
+        )
+
+
+# Fields read by the raw notification history query
+NOTIFICATION_PROJECTION = {
+    "customer": 1, "content": 1, "message_type": 1, "role": 1, "created_at": 1, "metadata": 1
+}
 
 
 @router.post("/config", response_model=NotificationConfigResponse)
@@ -71,6 +97,15 @@ async def create_notification_config(
             detail="Notification config with this name already exists"
         )
     
+    # Parse and validate the template once, the compiled form is reused when sending
+    try:
+        compile_template(config_data.body_template)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
     config = NotificationConfig(
         name=config_data.name,
         description=config_data.description,
@@ -98,18 +133,33 @@ async def create_notification_config(
 
 @router.get("/config", response_model=List[NotificationConfigResponse])
 async def list_notification_configs(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     is_active: Optional[bool] = None,
+    after: Optional[str] = None,
     current_user = Depends(get_current_active_user)
 ):
-    """List notification configurations."""
+    """
+    List notification configurations.
+    
+    Pass the X-Next-Cursor response header back as `after` to fetch the next
+    page with an index seek; `skip` keeps working for older clients.
+    """
     NotificationConfig = get_notification_config()
     query = {}
     if is_active is not None:
         query["is_active"] = is_active
+    try:
+        query = keyset_query(query, after)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     
-    configs = await NotificationConfig.find(query).skip(skip).limit(limit).to_list(length=limit)
+    configs = await NotificationConfig.find(query).sort(KEYSET_SORT).skip(skip).limit(limit).to_list(length=limit)
+    set_next_cursor(response, configs, limit)
     
     return [
         NotificationConfigResponse(
@@ -162,6 +212,12 @@ async def send_notification(
     current_user = Depends(get_current_active_user)
 ):
     """Send notification to customers using TaskIQ."""
+    if request.send_mode not in SEND_MODES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"send_mode must be one of {list(SEND_MODES)}"
+        )
+    
     NotificationConfig = get_notification_config()
     # Validate notification config
     config = await NotificationConfig.find_one({"_id": ObjectId(request.notification_config_id)})
@@ -191,15 +247,9 @@ async def send_notification(
             )
         customer_ids = request.customer_ids
     
-    result = await send_notification_task.kiq(
-        customer_ids=customer_ids,
-        notification_config_id=request.notification_config_id,
-        data=request.data,
-        user_id=str(current_user.id)
-    )
-    job_id = result.task_id
     # Create task record
     Task = get_task()
+    job_id = uuid.uuid4().hex
     task = Task(
         job_id=job_id,
         task_name="send_notification",
@@ -208,11 +258,26 @@ async def send_notification(
         parameters={
             "customer_ids": customer_ids,
             "notification_config_id": request.notification_config_id,
-            "data": request.data
+            "data": request.data,
+            "send_mode": request.send_mode
         }
     )
+    # The record must exist before a worker can pick the task up
     await task.commit()
     
+    # Large audiences are split into shards by the task itself, off the request path
+    try:
+        await send_notification_task.kicker().with_task_id(job_id).kiq(
+            customer_ids=customer_ids,
+            notification_config_id=request.notification_config_id,
+            data=request.data,
+            user_id=str(current_user.id),
+            send_mode=request.send_mode
+        )
+    except Exception:
+        await task.delete()
+        raise
+    
     return {
         "message": "Chat notification sending started",
         "job_id": task.job_id,
@@ -225,52 +290,78 @@ async def send_notification(
 
 @router.get("/history", response_model=List[NotificationResponse])
 async def get_notification_history(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     customer_id: Optional[str] = None,
+    after: Optional[str] = None,
     current_user = Depends(get_current_active_user)
 ):
-    """Get chat notification history."""
+    """
+    Get chat notification history.
+    
+    Pass the X-Next-Cursor response header back as `after` to fetch the next
+    page with an index seek; `skip` keeps working for older clients.
+    """
     Message = get_message()
     query = {"message_type": "system"}
     if customer_id:
         query["customer"] = ObjectId(customer_id)
+    try:
+        query = keyset_query(query, after)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     
-    messages = await Message.find(query).sort("created_at", -1).skip(skip).limit(limit).to_list(length=limit)
+    messages = await find_raw(
+        Message, query, NOTIFICATION_PROJECTION, sort=KEYSET_SORT, skip=skip, limit=limit
+    )
+    set_next_cursor(response, messages, limit)
     
-    return [
-        NotificationResponse(
-            id=str(msg.id),
-            customer_id=str(msg.customer),
-            config_id=msg.metadata.get("notification_config_id", "") if msg.metadata else "",
-            content=msg.content,
-            message_type=msg.message_type,
-            role=msg.role,
-            created_at=msg.created_at.isoformat(),
-            metadata=msg.metadata
-        )
-        for msg in messages
-    ]
+    return [NotificationResponse.from_doc(msg) for msg in messages]
 
 
 @router.get("/stats")
 async def get_notification_stats(
+    config_id: Optional[str] = None,
     current_user = Depends(get_current_active_user)
 ):
-    Message = get_message()
-    """Get chat notification statistics."""
-    total_notifications = await Message.count_documents({"message_type": "system"})
+    """
+    Get chat notification statistics.
     
-    # Get notifications from last 30 days
-    from datetime import datetime, timedelta
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-    recent_notifications = await Message.count_documents({
-        "message_type": "system",
-        "created_at": {"$gte": thirty_days_ago}
-    })
+    Reads the pre-aggregated report counters instead of counting messages,
+    optionally scoped to one notification config. Until the counters have
+    been backfilled over all history, messages are counted directly.
+    """
+    from datetime import timedelta
+    if not await report_counters.is_backfilled():
+        Message = get_message()
+        query = {"message_type": "system"}
+        if config_id:
+            query["metadata.notification_config_id"] = config_id
+        total_notifications = await Message.count_documents(query)
+    
+        # Get notifications from last 30 days
+        thirty_days_ago = datetime.now(UTC) - timedelta(days=30)
+        recent_notifications = await Message.count_documents({
+            **query,
+            "created_at": {"$gte": thirty_days_ago}
+        })
+    else:
+        scope, key = ("config", config_id) if config_id else ("day", DAY_SCOPE_KEY)
+        daily = await report_counters.get_counts(scope, key)
+        
+        # Get notifications from last 30 days
+        thirty_days_ago = report_date(datetime.now(UTC) - timedelta(days=30))
+        total_notifications = sum(counts.get("system", 0) for counts in daily.values())
+        recent_notifications = sum(
+            counts.get("system", 0) for date, counts in daily.items() if date >= thirty_days_ago
+        )
     
     return {
         "total_notifications": total_notifications,
         "recent_notifications": recent_notifications,
         "notification_type": "chat"
-    } 
\ No newline at end of file
+    } 
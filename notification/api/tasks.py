@@ -1,12 +1,19 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from typing import List, Optional, Dict, Any
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from models import get_task
 from services.auth import get_current_active_user
+from utils.pagination import KEYSET_SORT, keyset_query, set_next_cursor
+from utils.sse import format_sse, SSE_HEADERS
+from services.progress import progress_broadcaster, publish_progress, request_cancel, PROGRESS_FIELDS, TERMINAL_STATUSES
 from datetime import datetime
 
 router = APIRouter(prefix="/tasks", tags=["Tasks"])
 
+SSE_KEEPALIVE_SECONDS = 15
+
 
 class TaskResponse(BaseModel):
     id: str
@@ -22,6 +29,10 @@ class TaskResponse(BaseModel):
     completed_at: Optional[str]
     error_message: Optional[str]
     result: Optional[dict]
+    parent_job_id: Optional[str] = None
+    shard_count: int = 0
+    completed_shards: int = 0
+    failed_shards: int = 0
 
 
 class TaskStats(BaseModel):
@@ -31,17 +42,25 @@ class TaskStats(BaseModel):
     completed_tasks: int
     failed_tasks: int
     cancelled_tasks: int
+    by_task_name: Dict[str, Dict[str, int]] = {}
 
 
 @router.get("/", response_model=List[TaskResponse])
 async def list_tasks(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     status_filter: Optional[str] = Query(None),
     task_name: Optional[str] = Query(None),
+    after: Optional[str] = Query(None),
     current_user = Depends(get_current_active_user)
 ):
-    """List all tasks with filtering and pagination."""
+    """
+    List all tasks with filtering and pagination.
+    
+    Pass the X-Next-Cursor response header back as `after` to fetch the next
+    page with an index seek; `skip` keeps working for older clients.
+    """
     Task = get_task()
     # Build query
     query = {}
@@ -49,8 +68,16 @@ async def list_tasks(
         query["status"] = status_filter
     if task_name:
         query["task_name"] = {"$regex": task_name, "$options": "i"}
+    try:
+        query = keyset_query(query, after)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     
-    tasks = await Task.find(query).sort("created_at", -1).skip(skip).limit(limit).to_list(length=limit)
+    tasks = await Task.find(query).sort(KEYSET_SORT).skip(skip).limit(limit).to_list(length=limit)
+    set_next_cursor(response, tasks, limit)
     
     return [
         TaskResponse(
@@ -66,12 +93,61 @@ async def list_tasks(
             started_at=task.started_at.isoformat() if task.started_at else None,
             completed_at=task.completed_at.isoformat() if task.completed_at else None,
             error_message=task.error_message,
-            result=task.result
+            result=task.result,
+            parent_job_id=task.parent_job_id,
+            shard_count=task.shard_count,
+            completed_shards=task.completed_shards,
+            failed_shards=task.failed_shards
         )
         for task in tasks
     ]
 
 
+@router.get("/{job_id}/events")
+async def stream_task_events(
+    job_id: str,
+    request: Request,
+    current_user = Depends(get_current_active_user)
+):
+    """
+    Stream live progress of a task as server-sent events.
+    
+    Sends the current snapshot first, then every progress update published
+    by the workers, and closes once the task reaches a final status.
+    """
+    Task = get_task()
+    if not await Task.collection.find_one({"job_id": job_id}, {"_id": 1}):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Task not found"
+        )
+    
+    async def event_stream():
+        # Subscribe before reading the snapshot so no update falls in between
+        async with progress_broadcaster.subscribe(job_id) as queue:
+            snapshot = await Task.collection.find_one({"job_id": job_id}, PROGRESS_FIELDS)
+            while snapshot:
+                yield format_sse(snapshot, event="progress")
+                if snapshot.get("status") in TERMINAL_STATUSES:
+                    return
+                snapshot = None
+                while snapshot is None:
+                    try:
+                        snapshot = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        if await request.is_disconnected():
+                            return
+                        yield ": keepalive\n\n"
+                        # Catch a final update missed while the subscription was reconnecting
+                        latest = await Task.collection.find_one({"job_id": job_id}, PROGRESS_FIELDS)
+                        if not latest:
+                            return
+                        if latest.get("status") in TERMINAL_STATUSES:
+                            snapshot = latest
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 @router.get("/{job_id}", response_model=TaskResponse)
 async def get_task_by_job_id(
     job_id: str,
@@ -99,7 +175,11 @@ async def get_task_by_job_id(
         started_at=task.started_at.isoformat() if task.started_at else None,
         completed_at=task.completed_at.isoformat() if task.completed_at else None,
         error_message=task.error_message,
-        result=task.result
+        result=task.result,
+        parent_job_id=task.parent_job_id,
+        shard_count=task.shard_count,
+        completed_shards=task.completed_shards,
+        failed_shards=task.failed_shards
     )
 
 
@@ -123,11 +203,22 @@ async def cancel_task(
             detail=f"Cannot cancel task with status: {task.status}"
         )
     
+    # Running workers and the task's shards stop after their current batch
+    await request_cancel(job_id)
+    
     # Update task status
     task.status = "cancelled"
     task.completed_at = datetime.now()
+    # A cancelled import no longer blocks uploading the same file again
+    if task.dedupe_key is not None:
+        del task.dedupe_key
     await task.commit()
     
+    # Event stream subscribers see the cancellation without waiting for a worker
+    snapshot = await Task.collection.find_one({"job_id": job_id}, PROGRESS_FIELDS)
+    if snapshot:
+        await publish_progress(snapshot)
+    
     return {"message": "Task cancelled successfully", "job_id": job_id}
 
 
@@ -135,23 +226,18 @@ async def cancel_task(
 async def get_task_stats(
     current_user = Depends(get_current_active_user)
 ):
-    Task = get_task()
     """Get task statistics overview."""
-    # Count tasks by status
-    total_tasks = await Task.count_documents({})
-    pending_tasks = await Task.count_documents({"status": "pending"})
-    running_tasks = await Task.count_documents({"status": "running"})
-    completed_tasks = await Task.count_documents({"status": "completed"})
-    failed_tasks = await Task.count_documents({"status": "failed"})
-    cancelled_tasks = await Task.count_documents({"status": "cancelled"})
+    stats = await aggregate_task_stats({}, daily=False)
+    by_status = stats["by_status"]
     
     return TaskStats(
-        total_tasks=total_tasks,
-        pending_tasks=pending_tasks,
-        running_tasks=running_tasks,
-        completed_tasks=completed_tasks,
-        failed_tasks=failed_tasks,
-        cancelled_tasks=cancelled_tasks
+        total_tasks=sum(by_status.values()),
+        pending_tasks=by_status.get("pending", 0),
+        running_tasks=by_status.get("running", 0),
+        completed_tasks=by_status.get("completed", 0),
+        failed_tasks=by_status.get("failed", 0),
+        cancelled_tasks=by_status.get("cancelled", 0),
+        by_task_name=stats["by_task_name"]
     )
 
 
@@ -160,7 +246,6 @@ async def get_recent_task_stats(
     days: int = Query(7, ge=1, le=30),
     current_user = Depends(get_current_active_user)
 ):
-    Task = get_task()
     """Get recent task statistics."""
     from datetime import timedelta
     
@@ -168,15 +253,15 @@ async def get_recent_task_stats(
     end_date = datetime.now()
     start_date = end_date - timedelta(days=days)
     
-    # Get tasks in date range
-    recent_tasks = await Task.find({
+    stats = await aggregate_task_stats({
         "created_at": {"$gte": start_date, "$lte": end_date}
-    }).to_list()
+    })
+    by_status = stats["by_status"]
     
     # Calculate statistics
-    total_recent = len(recent_tasks)
-    completed_recent = len([t for t in recent_tasks if t.status == "completed"])
-    failed_recent = len([t for t in recent_tasks if t.status == "failed"])
+    total_recent = sum(by_status.values())
+    completed_recent = by_status.get("completed", 0)
+    failed_recent = by_status.get("failed", 0)
     
     success_rate = (completed_recent / total_recent * 100) if total_recent > 0 else 0
     
@@ -187,5 +272,61 @@ async def get_recent_task_stats(
         "failed_tasks": failed_recent,
         "success_rate": f"{success_rate:.1f}%",
         "start_date": start_date.isoformat(),
-        "end_date": end_date.isoformat()
-    } 
\ No newline at end of file
+        "end_date": end_date.isoformat(),
+        "by_status": by_status,
+        "by_task_name": stats["by_task_name"],
+        "daily": stats["daily"]
+    } 
+
+
+async def aggregate_task_stats(match: Dict[str, Any], daily: bool = True) -> Dict[str, Any]:
+    """
+    Count tasks per status, per task_name and status, and per day in one aggregation.
+    
+    Grouping happens on the server over the (created_at, status) index, so
+    only the bucket counts come back regardless of how many tasks match.
+    """
+    Task = get_task()
+    facets = {
+        "by_status": [
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+        ],
+        "by_task_name": [
+            {"$group": {"_id": {"task_name": "$task_name", "status": "$status"}, "count": {"$sum": 1}}}
+        ]
+    }
+    if daily:
+        facets["daily"] = [
+            {"$group": {
+                "_id": {
+                    "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+                    "status": "$status"
+                },
+                "count": {"$sum": 1}
+            }},
+            {"$sort": {"_id.day": 1}}
+        ]
+    pipeline = [
+        {"$match": match},
+        {"$project": {"_id": 0, "status": 1, "task_name": 1, "created_at": 1}},
+        {"$facet": facets}
+    ]
+    
+    result = await Task.collection.aggregate(pipeline).to_list(length=1)
+    buckets = result[0] if result else {}
+    
+    by_status = {row["_id"]: row["count"] for row in buckets.get("by_status", [])}
+    by_task_name = {}
+    for row in buckets.get("by_task_name", []):
+        counts = by_task_name.setdefault(row["_id"]["task_name"], {"total": 0})
+        counts[row["_id"]["status"]] = row["count"]
+        counts["total"] += row["count"]
+    stats = {"by_status": by_status, "by_task_name": by_task_name}
+    if daily:
+        days = {}
+        for row in buckets.get("daily", []):
+            counts = days.setdefault(row["_id"]["day"], {"date": row["_id"]["day"], "total": 0})
+            counts[row["_id"]["status"]] = row["count"]
+            counts["total"] += row["count"]
+        stats["daily"] = list(days.values())
+    return stats
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark latency of an unrelated endpoint while logins are hammered,
+with bcrypt run inline on the event loop against the password hashing pool.
+
+Usage: python benchmarks/bench_login_burst.py [logins] [concurrency]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+
+from services.auth import get_password_hash, verify_password, verify_password_async
+
+PASSWORD = "benchmark-password"
+HASHED_PASSWORD = get_password_hash(PASSWORD)
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/login/inline")
+    async def login_inline():
+        return {"ok": verify_password(PASSWORD, HASHED_PASSWORD)}
+
+    @app.post("/login/pool")
+    async def login_pool():
+        return {"ok": await verify_password_async(PASSWORD, HASHED_PASSWORD)}
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+def percentile(values, pct: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * pct), len(values) - 1)]
+
+
+async def run_burst(client: httpx.AsyncClient, mode: str, logins: int, concurrency: int):
+    """Fire logins with bounded concurrency while pinging until they finish."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def login():
+        async with semaphore:
+            await client.post(f"/login/{mode}")
+
+    async def pinger(done: asyncio.Event):
+        while not done.is_set():
+            start = time.perf_counter()
+            await client.get("/ping")
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0.01)
+
+    done = asyncio.Event()
+    ping_task = asyncio.create_task(pinger(done))
+    start = time.perf_counter()
+    await asyncio.gather(*[login() for _ in range(logins)])
+    elapsed = time.perf_counter() - start
+    done.set()
+    await ping_task
+    return elapsed, latencies
+
+
+async def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    transport = httpx.ASGITransport(app=build_app())
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"Logins: {logins}, concurrency: {concurrency}")
+        for mode in ("inline", "pool"):
+            elapsed, latencies = await run_burst(client, mode, logins, concurrency)
+            print(
+                f"{mode:<6} logins {elapsed:.2f}s ({logins / elapsed:.1f}/s), "
+                f"/ping p50 {percentile(latencies, 0.5) * 1000:.1f}ms "
+                f"p99 {percentile(latencies, 0.99) * 1000:.1f}ms over {len(latencies)} requests"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark parsing and validating a customer CSV in chunks in one process
+against byte ranges spread over a process pool, as the parallel import does.
+
+Ranges are sized with plan_range_size and the pool is warmed up first, like
+the worker's shared pool after its first import. Speedup only shows with
+more than one CPU available.
+
+Usage: python benchmarks/bench_parallel_parse.py [rows] [max_workers]
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from benchmarks.bench_validators import build_frame
+from utils.file_formats import available_cpus, plan_range_size, split_csv_ranges, parse_customer_range
+from utils.validators import validate_customer_frame
+
+CHUNK_SIZE = 5000
+MAX_RANGE_SIZE = 8 * 1024 * 1024
+
+
+def bench_stream(file_path: str) -> float:
+    start = time.perf_counter()
+    with pd.read_csv(file_path, dtype=str, chunksize=CHUNK_SIZE) as reader:
+        for chunk in reader:
+            validate_customer_frame(chunk)
+    return time.perf_counter() - start
+
+
+def bench_parallel(file_path: str, workers: int) -> float:
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # Warm up every process so interpreter start and imports are not timed
+        header, ranges = split_csv_ranges(file_path, MAX_RANGE_SIZE)
+        list(pool.map(parse_customer_range, *zip(*[(file_path, header, *ranges[0])] * workers)))
+
+        start = time.perf_counter()
+        range_size = plan_range_size(os.path.getsize(file_path), workers, MAX_RANGE_SIZE)
+        header, ranges = split_csv_ranges(file_path, range_size)
+        futures = [pool.submit(parse_customer_range, file_path, header, *byte_range) for byte_range in ranges]
+        for future in futures:
+            future.result()
+        return time.perf_counter() - start
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else available_cpus()
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, "customers.csv")
+        build_frame(rows).to_csv(file_path, index=False)
+        print(f"Rows:                {rows} ({os.path.getsize(file_path) / 1024 / 1024:.1f} MB)")
+        print(f"CPUs available:      {available_cpus()}")
+
+        stream = bench_stream(file_path)
+        print(f"Chunked, 1 process:  {stream:.3f}s ({rows / stream:,.0f} rows/s)")
+
+        workers = 1
+        while workers <= max_workers:
+            parallel = bench_parallel(file_path, workers)
+            print(f"Ranges, {workers:2d} processes: {parallel:.3f}s ({rows / parallel:,.0f} rows/s, {stream / parallel:.1f}x)")
+            workers *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark building message history responses from hydrated umongo documents
+against building them straight from raw projected documents.
+
+Usage: python benchmarks/bench_raw_reads.py [messages]
+"""
+
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+
+from config.database import connect_to_mongo
+from models import get_message
+from api.message import MessageResponse, MESSAGE_PROJECTION
+
+
+def build_documents(messages: int):
+    """Build synthetic message documents as the driver returns them."""
+    chat_id, customer_id = ObjectId(), ObjectId()
+    start = datetime(2024, 1, 1)
+    return [
+        {
+            "_id": ObjectId(),
+            "chat": chat_id,
+            "customer": customer_id,
+            "content": f"Tin nhắn số {i}: cảm ơn quý khách đã sử dụng dịch vụ của FTEL.",
+            "role": "user" if i % 2 else "assistant",
+            "message_type": "user" if i % 2 else "ai",
+            "model_used": None if i % 2 else "gemini-1.5-flash",
+            "response_time": None if i % 2 else 0.42,
+            "metadata": {} if i % 2 else {"memory_count": 10},
+            "created_at": start + timedelta(seconds=i)
+        }
+        for i in range(messages)
+    ]
+
+
+def bench_hydrated(documents) -> float:
+    Message = get_message()
+    start = time.perf_counter()
+    hydrated = [Message.build_from_mongo(doc) for doc in documents]
+    [
+        MessageResponse(
+            id=str(msg.id),
+            content=msg.content,
+            role=msg.role,
+            message_type=msg.message_type,
+            created_at=msg.created_at.isoformat(),
+            metadata=msg.metadata
+        )
+        for msg in hydrated
+    ]
+    return time.perf_counter() - start
+
+
+def bench_raw(documents) -> float:
+    # The raw path only receives the projected fields from the server
+    projected = [
+        {key: doc[key] for key in ("_id", *MESSAGE_PROJECTION) if key in doc}
+        for doc in documents
+    ]
+    start = time.perf_counter()
+    [MessageResponse.from_doc(doc) for doc in projected]
+    return time.perf_counter() - start
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    asyncio.run(connect_to_mongo())  # The client connects lazily, no server needed
+    documents = build_documents(messages)
+
+    hydrated = bench_hydrated(documents)
+    raw = bench_raw(documents)
+
+    print(f"Messages:        {messages}")
+    print(f"umongo hydrated: {hydrated:.3f}s ({messages / hydrated:,.0f} messages/s)")
+    print(f"raw projected:   {raw:.3f}s ({messages / raw:,.0f} messages/s)")
+    print(f"Speedup:         {hydrated / raw:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark notification rendering with str.format against the compiled template cache.
+
+Usage: python benchmarks/bench_templates.py [recipients]
+"""
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.templates import compile_template
+
+TEMPLATE = (
+    "Xin chào {customer_name}, đơn hàng {order_id} của {company} đã được giao "
+    "vào {delivery_date}. Tổng tiền: {amount}. Liên hệ {support_email} nếu cần hỗ trợ."
+)
+DATA = {
+    "order_id": "SO-2024-0001",
+    "delivery_date": "2024-01-01",
+    "amount": "1.250.000 VND",
+    "support_email": "support@example.com",
+}
+
+
+def build_customers(recipients: int):
+    return [
+        {"full_name": f"Customer {i}", "email": f"user{i}@example.com", "company": "ACME" if i % 3 else None}
+        for i in range(recipients)
+    ]
+
+
+def bench_format(customers) -> float:
+    start = time.perf_counter()
+    for customer in customers:
+        TEMPLATE.format(**DATA, **{
+            "customer_name": customer["full_name"],
+            "customer_email": customer["email"],
+            "company": customer["company"] or "FTEL"
+        })
+    return time.perf_counter() - start
+
+
+def bench_compiled(customers) -> float:
+    start = time.perf_counter()
+    template = compile_template(TEMPLATE).partial(DATA)
+    for customer in customers:
+        template.render({
+            "customer_name": customer["full_name"],
+            "customer_email": customer["email"],
+            "company": customer["company"] or "FTEL"
+        })
+    return time.perf_counter() - start
+
+
+def main():
+    recipients = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    customers = build_customers(recipients)
+
+    formatted = bench_format(customers)
+    compiled = bench_compiled(customers)
+
+    print(f"Recipients:        {recipients}")
+    print(f"str.format:        {formatted:.3f}s ({recipients / formatted:,.0f} renders/s)")
+    print(f"compiled template: {compiled:.3f}s ({recipients / compiled:,.0f} renders/s)")
+    print(f"Speedup:           {formatted / compiled:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-row clean_customer_data against the vectorized validate_customer_frame.
+
+Usage: python benchmarks/bench_validators.py [rows]
+"""
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from utils.validators import clean_customer_data, validate_customer_frame
+
+
+def build_frame(rows: int) -> pd.DataFrame:
+    """Build a synthetic upload chunk with a few invalid rows mixed in."""
+    return pd.DataFrame({
+        "email": [f" User{i}@Example.com " if i % 50 else f"broken-{i}" for i in range(rows)],
+        "full_name": [f"Customer {i}" for i in range(rows)],
+        "phone": [f"(09) {i:04d}-{i % 10000:04d}" if i % 7 else None for i in range(rows)],
+        "company": ["ACME" if i % 3 else None for i in range(rows)],
+        "position": ["Manager"] * rows,
+        "address": [f"{i} Nguyen Trai" for i in range(rows)],
+        "city": ["Hanoi"] * rows,
+        "country": ["Vietnam"] * rows,
+        "language": ["vi" if i % 2 else None for i in range(rows)],
+        "tags": ["customer, vip" if i % 4 else None for i in range(rows)],
+    }, dtype="string")
+
+
+def bench_per_row(df: pd.DataFrame) -> float:
+    start = time.perf_counter()
+    for record in df.to_dict("records"):
+        try:
+            clean_customer_data(record)
+        except ValueError:
+            pass
+    return time.perf_counter() - start
+
+
+def bench_frame(df: pd.DataFrame) -> float:
+    start = time.perf_counter()
+    validate_customer_frame(df.copy())
+    return time.perf_counter() - start
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    df = build_frame(rows)
+
+    per_row = bench_per_row(df)
+    frame = bench_frame(df)
+
+    print(f"Rows:                    {rows}")
+    print(f"clean_customer_data:     {per_row:.3f}s ({rows / per_row:,.0f} rows/s)")
+    print(f"validate_customer_frame: {frame:.3f}s ({rows / frame:,.0f} rows/s)")
+    print(f"Speedup:                 {per_row / frame:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Index bootstrapper: creates the indexes declared in the models' Meta and
+checks the hot query shapes against them with explain().
+"""
+
+from typing import List, Dict, Any, Tuple
+from bson import ObjectId
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+from models import registry
+from utils.pagination import KEYSET_SORT
+
+
+# Hot query shapes as (model, description, filter, sort), mirroring
+# services/memory_manager.py, services/context_cache.py, api/message.py,
+# api/notification.py and tasks/send_notification.py
+_customer_id = ObjectId()
+HOT_QUERIES: List[Tuple[str, str, Dict[str, Any], List[Tuple[str, int]]]] = [
+    ("Chat", "active chat session of a customer",
+     {"customer": _customer_id, "is_active": True}, []),
+    ("Chat", "active chat sessions of a customer batch",
+     {"customer": {"$in": [_customer_id]}, "is_active": True}, []),
+    ("Message", "long-term memory",
+     {"customer": _customer_id, "message_type": {"$ne": "system"}}, [("created_at", -1)]),
+    ("Message", "recent notifications of a customer",
+     {"customer": _customer_id, "message_type": "system"}, [("created_at", -1)]),
+    ("Message", "message history of a customer",
+     {"customer": _customer_id}, [("created_at", -1)]),
+    ("Message", "notification history",
+     {"message_type": "system"}, KEYSET_SORT),
+    ("Message", "notification history of a customer",
+     {"message_type": "system", "customer": _customer_id}, KEYSET_SORT),
+    ("Customer", "customer by email",
+     {"email": "customer@example.com"}, []),
+    ("Customer", "import hashes of an email batch",
+     {"email": {"$in": ["customer@example.com"]}}, []),
+    ("Customer", "customer list",
+     {}, KEYSET_SORT),
+    ("NotificationConfig", "notification config list",
+     {"is_active": True}, KEYSET_SORT),
+    ("Task", "task by job id",
+     {"job_id": "job"}, []),
+    ("Task", "shards of a sharded task",
+     {"parent_job_id": "job"}, []),
+    ("Task", "task list",
+     {"status": "running"}, KEYSET_SORT),
+]
+
+
+def _merge_index_models(indexes: List[IndexModel]) -> List[IndexModel]:
+    """
+    Merge index models declared for the same keys.
+
+    umongo declares a plain index for every Meta entry and another one for
+    each `unique` field, which MongoDB rejects as conflicting options.
+    """
+    merged = {}
+    for index in indexes:
+        document = index.document.copy()
+        keys = tuple(document.pop("key").items())
+        merged.setdefault(keys, {}).update(document)
+    return [IndexModel(list(keys), **options) for keys, options in merged.items()]
+
+
+async def ensure_indexes() -> int:
+    """
+    Create every model index, skipping those already present.
+
+    An index that exists with different options is reported and left as is.
+
+    Returns:
+        Number of indexes that could not be created
+    """
+    failed = 0
+    for name, model in registry.get_all_models().items():
+        for index in _merge_index_models(model.indexes):
+            try:
+                await model.collection.create_indexes([index])
+            except OperationFailure as e:
+                failed += 1
+                print(f"[INDEXES] {name}: could not create {index.document['name']}: {e}")
+    return failed
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    """Flatten the stage names of an explain() plan tree."""
+    stages = [plan.get("stage")]
+    for child_key in ("inputStage", "queryPlan"):
+        if child_key in plan:
+            stages.extend(_plan_stages(plan[child_key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+
+async def explain_hot_queries() -> List[str]:
+    """
+    Explain every hot query shape and report the ones without a usable index.
+
+    Only the query planner runs, no documents are read.
+
+    Returns:
+        Descriptions of the query shapes that fall back to a collection scan
+        or an in-memory sort
+    """
+    models = registry.get_all_models()
+    problems = []
+    for model_name, description, query, sort in HOT_QUERIES:
+        collection = models[model_name].collection
+        command = {"find": collection.name, "filter": query, "limit": 1}
+        if sort:
+            command["sort"] = dict(sort)
+        result = await collection.database.command({"explain": command, "verbosity": "queryPlanner"})
+        stages = _plan_stages(result["queryPlanner"]["winningPlan"])
+        if "COLLSCAN" in stages:
+            problems.append(f"{model_name}: {description} (COLLSCAN)")
+        elif "SORT" in stages:
+            problems.append(f"{model_name}: {description} (in-memory SORT)")
+    for problem in problems:
+        print(f"[INDEXES] Unindexed query shape: {problem}")
+    return problems
+
+
+async def bootstrap_indexes():
+    """Create the model indexes and check the hot queries against them."""
+    failed = await ensure_indexes()
+    problems = await explain_hot_queries()
+    print(f"[INDEXES] Indexes ensured ({failed} failed), {len(problems)} unindexed query shapes.")
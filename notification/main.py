@@ -9,7 +9,10 @@ from config.database import (
     close_redis_connection
 )
 from config.settings import settings
+from config.indexes import bootstrap_indexes
 from models import register_all_models
+from services.memory_manager import memory_manager
+from services.progress import progress_broadcaster
 
 # Import API routers
 from api.auth import router as auth_router
@@ -28,10 +31,25 @@ async def lifespan(app: FastAPI):
     # Register all models after database connection
     register_all_models()
     
+    # Create compound indexes for hot queries and report unindexed query shapes
+    try:
+        await bootstrap_indexes()
+    except Exception as e:
+        print(f"Index bootstrap skipped: {str(e)}")
+    
+    # Convert legacy JSON short-term memory keys to Redis lists
+    try:
+        migrated = await memory_manager.migrate_legacy_short_term_memory()
+        if migrated:
+            print(f"Migrated {migrated} short-term memory keys to Redis lists.")
+    except Exception as e:
+        print(f"Short-term memory migration skipped: {str(e)}")
+    
     print("Application started successfully!")
     
     yield
     
+    await progress_broadcaster.close()
     await close_mongo_connection()
     await close_redis_connection()
     print("Application shutdown complete!")
@@ -50,6 +68,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 app.include_router(auth_router)
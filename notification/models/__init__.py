@@ -12,6 +12,7 @@ from .notification import (
 )
 from .chat import Chat, Message, get_chat_model, get_message_model
 from .task import Task, get_task_model
+from .report import NotificationReport, get_notification_report_model
 
 
 class ModelRegistry:
@@ -34,6 +35,7 @@ class ModelRegistry:
         self._models['Chat'] = get_chat_model()
         self._models['Message'] = get_message_model()
         self._models['Task'] = get_task_model()
+        self._models['NotificationReport'] = get_notification_report_model()
         
         self._registered = True
         print("All models registered successfully!")
@@ -91,6 +93,11 @@ def get_task():
     return registry.get_model('Task')
 
 
+def get_notification_report():
+    """Get NotificationReport model."""
+    return registry.get_model('NotificationReport')
+
+
 def register_all_models():
     """Register all models with database."""
     registry.register_all() 
\ No newline at end of file
@@ -18,7 +18,15 @@ class Chat(Document):
         indexes = [
             "customer",
             "session_id",
-            "is_active"
+            "is_active",
+            # Active session lookup per customer; at most one active session
+            # each, so concurrent upserts cannot create duplicates
+            {
+                "key": ["customer", "is_active"],
+                "name": "customer_active_unique",
+                "unique": True,
+                "partialFilterExpression": {"is_active": True}
+            }
         ]
     
     def __str__(self):
@@ -47,7 +55,13 @@ class Message(Document):
             "chat",
             "customer",
             "message_type",
-            "created_at"
+            "created_at",
+            # Per-customer history and long-term memory, newest first
+            ("customer", "created_at"),
+            # Keyset pagination of notification history, optionally per customer
+            ("message_type", "created_at", "_id"),
+            # Also serves recent notifications and typed history per customer
+            ("customer", "message_type", "created_at", "_id")
         ]
     
     def __str__(self):
@@ -18,6 +18,7 @@ class Customer(Document):
     is_active = fields.BoolField(default=True)
     tags = fields.ListField(fields.StrField(), default=list)
     metadata = fields.DictField(default=dict)
+    import_hash = fields.StrField()  # Content hash of the last merged import row
     created_at = fields.DateTimeField(default=lambda: datetime.now(UTC))
     updated_at = fields.DateTimeField(default=lambda: datetime.now(UTC))
     
@@ -27,7 +28,11 @@ class Customer(Document):
             "email",
             "phone",
             "company",
-            "tags"
+            "tags",
+            # Merge imports compare row hashes without fetching documents
+            ("email", "import_hash", "_id"),
+            # Keyset pagination
+            ("created_at", "_id")
         ]
     
     def __str__(self):
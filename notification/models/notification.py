@@ -24,7 +24,11 @@ class NotificationConfig(Document):
         indexes = [
             "name",
             "notification_type",
-            "is_active"
+            "is_active",
+            # Keyset pagination
+            ("created_at", "_id"),
+            # Keyset pagination of active configs
+            ("is_active", "created_at", "_id")
         ]
     
     def __str__(self):
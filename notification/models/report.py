@@ -0,0 +1,30 @@
+from umongo import Document, fields
+from datetime import datetime, UTC
+from config.database import get_umongo_instance
+
+
+class NotificationReport(Document):
+    """Pre-aggregated message counters for one scope, key and day."""
+    
+    scope = fields.StrField(required=True)  # day, config, customer
+    key = fields.StrField(required=True)  # config or customer id, "all" for day
+    date = fields.StrField(required=True)  # YYYY-MM-DD (UTC)
+    counts = fields.DictField(default=dict)  # message_type -> count
+    updated_at = fields.DateTimeField(default=lambda: datetime.now(UTC))
+    reconciled_at = fields.DateTimeField()
+    
+    class Meta:
+        collection_name = "notification_reports"
+        indexes = [
+            {"key": ["scope", "key", "date"], "unique": True},
+            ("scope", "date")
+        ]
+    
+    def __str__(self):
+        return f"NotificationReport({self.scope}:{self.key} {self.date})"
+
+
+# Lazy registration
+def get_notification_report_model():
+    """Get NotificationReport model with database registration."""
+    return get_umongo_instance().register(NotificationReport)
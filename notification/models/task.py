@@ -16,11 +16,19 @@ class Task(Document):
     processed_items = fields.IntField(default=0)
     failed_items = fields.IntField(default=0)
     
+    # Sharded tasks: children point at the parent, which rolls up their progress
+    parent_job_id = fields.StrField()
+    shard_count = fields.IntField(default=0)
+    completed_shards = fields.IntField(default=0)
+    failed_shards = fields.IntField(default=0)
+    
     # Task metadata
     user_id = fields.ReferenceField("User")
     parameters = fields.DictField(default=dict)
     result = fields.DictField(default=dict)
     error_message = fields.StrField()
+    # Content hash of an import upload while it is active or completed
+    dedupe_key = fields.StrField()
     
     # Timing
     created_at = fields.DateTimeField(default=lambda: datetime.now(UTC))
@@ -39,7 +47,15 @@ class Task(Document):
             "task_name",
             "status",
             "user_id",
-            "created_at"
+            "parent_job_id",
+            # Stats aggregations match on created_at and group by status
+            ("created_at", "status"),
+            # Keyset pagination
+            ("created_at", "_id"),
+            # Keyset pagination of the task list filtered by status
+            ("status", "created_at", "_id"),
+            # Duplicate upload detection, unset when an import fails or is cancelled
+            {"key": ["dedupe_key"], "unique": True, "sparse": True}
         ]
     
     def __str__(self):
@@ -20,6 +20,15 @@ class User(Document):
             "email"
         ]
     
+    async def post_update(self, ret):
+        # Cached auth entries must not outlive a deactivation or password change
+        from services.user_cache import user_cache
+        await user_cache.invalidate(self.username)
+    
+    async def post_delete(self, ret):
+        from services.user_cache import user_cache
+        await user_cache.invalidate(self.username)
+    
     def __str__(self):
         return f"User({self.username})"
 
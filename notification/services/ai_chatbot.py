@@ -1,5 +1,5 @@
 import time
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, AsyncIterator
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, SystemMessage
 from config.settings import settings
@@ -27,12 +27,13 @@ class AIChatbot:
         self,
         customer_id: str,
         message: str,
-        customer_info: Optional[Dict[str, Any]] = None
+        customer_info: Optional[Dict[str, Any]] = None,
+        context: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         start_time = time.time()
 
         try:
-            memory = await memory_manager.get_combined_memory(customer_id)
+            memory = self._get_memory(context) if context else await memory_manager.get_combined_memory(customer_id)
             context, recent_notifications = self._build_context_and_notifs(memory, customer_info)
             messages = self._create_messages(context, message, recent_notifications)
             response = await self.model.ainvoke(messages)
@@ -61,6 +62,72 @@ class AIChatbot:
                 "error": str(e)
             }
 
+    async def stream_response(
+        self,
+        customer_id: str,
+        message: str,
+        result: Dict[str, Any],
+        customer_info: Optional[Dict[str, Any]] = None,
+        context: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream the AI response token by token from the model's async stream.
+
+        Once the stream ends, `result` is filled with the same response data
+        that generate_response returns, so the caller can persist it.
+        """
+        start_time = time.time()
+        parts = []
+
+        try:
+            memory = self._get_memory(context) if context else await memory_manager.get_combined_memory(customer_id)
+            prompt_context, recent_notifications = self._build_context_and_notifs(memory, customer_info)
+            messages = self._create_messages(prompt_context, message, recent_notifications)
+            async for chunk in self.model.astream(messages):
+                text = self._chunk_text(chunk)
+                if text:
+                    parts.append(text)
+                    yield text
+            result.update({
+                "content": "".join(parts),
+                "role": "assistant",
+                "message_type": "ai",
+                "response_time": time.time() - start_time,
+                "model_used": settings.gemini_model,
+                "metadata": {
+                    "memory_count": len(memory),
+                    "customer_info": customer_info,
+                    "streamed": True
+                }
+            })
+        except Exception as e:
+            print("[AIChatbot Exception]:", e)
+            if not parts:
+                parts.append("Xin lỗi, tôi đang gặp sự cố kỹ thuật. Vui lòng thử lại sau.")
+                yield parts[0]
+            result.update({
+                "content": "".join(parts),
+                "role": "assistant",
+                "message_type": "ai",
+                "response_time": time.time() - start_time,
+                "model_used": settings.gemini_model,
+                "error": str(e)
+            })
+
+    def _chunk_text(self, chunk) -> str:
+        # Gemini có thể trả content dạng list các part thay vì string
+        content = chunk.content if hasattr(chunk, "content") else chunk
+        if isinstance(content, str):
+            return content
+        return "".join(
+            part.get("text", "") if isinstance(part, dict) else str(part)
+            for part in content
+        )
+
+    def _get_memory(self, context: Dict[str, Any]) -> List[Dict[str, Any]]:
+        # Context từ cache đã có sẵn memory kết hợp như get_combined_memory
+        return context["memory"]
+
     def _build_context_and_notifs(
         self,
         memory: List[Dict[str, Any]],
@@ -112,7 +179,6 @@ class AIChatbot:
             "message_type": "user",
             "timestamp": time.time()
         }
-        await memory_manager.add_to_short_term_memory(customer_id, user_msg)
         ai_msg = {
             "role": "assistant",
             "content": ai_response["content"],
@@ -121,7 +187,7 @@ class AIChatbot:
             "model_used": ai_response.get("model_used"),
             "response_time": ai_response.get("response_time")
         }
-        await memory_manager.add_to_short_term_memory(customer_id, ai_msg)
+        await memory_manager.add_many_to_short_term_memory(customer_id, [user_msg, ai_msg])
 
 # Global AI chatbot instance
 ai_chatbot = AIChatbot()
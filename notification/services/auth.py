@@ -1,3 +1,5 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -6,6 +8,7 @@ from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer
 from config.settings import settings
 from models import get_user
+from services.user_cache import user_cache
 
 
 # Password hashing
@@ -15,6 +18,13 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
 
+# Bounded pool for bcrypt, which releases the GIL while hashing
+password_executor = ThreadPoolExecutor(
+    max_workers=settings.password_hash_workers,
+    thread_name_prefix="password-hash"
+)
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
     return pwd_context.verify(plain_password, hashed_password)
@@ -25,6 +35,20 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password on the hashing pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        password_executor, verify_password, plain_password, hashed_password
+    )
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password on the hashing pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token."""
     to_encode = data.copy()
@@ -60,7 +84,7 @@ async def authenticate_user(username: str, password: str):
         user = await User.find_one({"username": username})
         if not user:
             return None
-        if not verify_password(password, user.hashed_password):
+        if not await verify_password_async(password, user.hashed_password):
             return None
         return user
     except Exception:
@@ -84,8 +108,7 @@ async def get_current_user(credentials = Depends(security)):
     if username is None:
         raise credentials_exception
     
-    User = get_user()
-    user = await User.find_one({"username": username})
+    user = await user_cache.get_user(username, payload.get("exp"))
     if user is None:
         raise credentials_exception
     
@@ -0,0 +1,143 @@
+import asyncio
+import json
+from typing import List, Dict, Any, Optional
+from config.database import get_redis
+from config.settings import settings
+from models import get_customer, get_chat
+from services.memory_manager import memory_manager, combine_memory
+from bson import ObjectId
+
+
+class ContextCache:
+    """
+    Per-customer chat context cached in Redis.
+
+    Each entry holds the customer profile snippet, the active chat id, the
+    last notifications and the long-term conversation history. The rolling
+    conversation window is the short-term memory list, read in the same
+    pipeline and combined with the cached history exactly as
+    get_combined_memory does, so a warm chat turn costs one Redis round trip
+    instead of four database queries. Entries are invalidated when new
+    system messages are written for the customer; turns written after an
+    entry was built reach it through the short-term window.
+    """
+
+    def __init__(self):
+        self._redis = None
+        self.ttl = settings.context_cache_ttl
+
+    @property
+    def redis(self):
+        """Lazy initialization of Redis connection."""
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    def _key(self, customer_id: str) -> str:
+        return f"context:customer:{customer_id}"
+
+    async def get_context(self, customer_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the chat context for a customer, building and caching it on a miss.
+
+        Returns:
+            Dict with "profile", "chat_id", "notifications", "history",
+            "conversation" and the combined "memory", or None if the
+            customer does not exist
+        """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.get(self._key(customer_id))
+            pipe.lrange(
+                memory_manager.short_term_key(customer_id),
+                -settings.context_conversation_limit, -1
+            )
+            cached, conversation = await pipe.execute(raise_on_error=False)
+
+        if isinstance(conversation, Exception):
+            # Legacy string memory key, the memory manager migrates it
+            conversation = await memory_manager.get_short_term_memory(
+                customer_id, limit=settings.context_conversation_limit
+            )
+        else:
+            conversation = [json.loads(item) for item in conversation]
+
+        if isinstance(cached, str):
+            context = json.loads(cached)
+        else:
+            context = await self._build_context(customer_id)
+            if context is None:
+                return None
+
+        if not conversation:
+            conversation = await self._seed_conversation(customer_id)
+
+        context["conversation"] = conversation
+        # Entries cached before history was added carry none until they expire
+        context["memory"] = combine_memory(conversation, context.get("history", []), context["notifications"])
+        return context
+
+    async def _build_context(self, customer_id: str) -> Optional[Dict[str, Any]]:
+        """Load profile, active chat, notifications and history from MongoDB and cache them."""
+        Customer = get_customer()
+        Chat = get_chat()
+        customer = await Customer.collection.find_one(
+            {"_id": ObjectId(customer_id)},
+            {"full_name": 1, "email": 1, "company": 1}
+        )
+        if not customer:
+            return None
+
+        chat = await Chat.collection.find_one(
+            {"customer": ObjectId(customer_id), "is_active": True}, {"_id": 1}
+        )
+        notifications, history = await asyncio.gather(
+            memory_manager.get_recent_notifications(
+                customer_id, limit=settings.context_notification_limit
+            ),
+            memory_manager.get_long_term_memory(
+                customer_id, limit=settings.context_history_limit, exclude_system=True
+            )
+        )
+        context = {
+            "profile": {
+                "full_name": customer.get("full_name"),
+                "email": customer.get("email"),
+                "company": customer.get("company")
+            },
+            "chat_id": str(chat["_id"]) if chat else None,
+            "notifications": notifications,
+            "history": history
+        }
+        # A missing chat is created by the caller, so only cache resolved ones
+        if context["chat_id"]:
+            await self.redis.set(self._key(customer_id), json.dumps(context), ex=self.ttl)
+        return context
+
+    async def _seed_conversation(self, customer_id: str) -> List[Dict[str, Any]]:
+        """
+        Refill an expired conversation window from long-term memory.
+
+        History is prepended with LPUSH so turns appended concurrently stay
+        after it.
+        """
+        history = await memory_manager.get_long_term_memory(
+            customer_id, limit=settings.context_conversation_limit, exclude_system=True
+        )
+        if history:
+            key = memory_manager.short_term_key(customer_id)
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.lpush(key, *[json.dumps(msg) for msg in reversed(history)])
+                pipe.ltrim(key, -settings.max_conversation_history, -1)
+                pipe.expire(key, settings.short_term_memory_ttl)
+                await pipe.execute(raise_on_error=False)
+        return history
+
+    async def invalidate(self, customer_ids: List[Any]):
+        """Drop cached contexts, e.g. after new system messages were written."""
+        keys = [self._key(str(customer_id)) for customer_id in customer_ids]
+        if keys:
+            await self.redis.delete(*keys)
+
+
+# Global context cache instance
+context_cache = ContextCache()
@@ -1,11 +1,69 @@
+import asyncio
+import heapq
 import json
-from typing import List, Dict, Any
+from datetime import datetime, UTC
+from typing import List, Dict, Any, Optional
+from redis.exceptions import ResponseError, WatchError
 from config.database import get_redis
 from config.settings import settings
 from models import get_message
 from bson import ObjectId
 
 
+# Fields read for memory, skipping umongo hydration of full Message documents
+MEMORY_PROJECTION = {"_id": 0, "role": 1, "content": 1, "created_at": 1, "message_type": 1}
+# The same turn is stamped in Redis (time.time() after the reply) and in
+# MongoDB (created_at on commit); copies this close together are one turn
+MEMORY_DEDUPE_WINDOW_SECONDS = 60
+
+
+def _timestamp_value(msg: Dict[str, Any]) -> float:
+    """Normalize a memory timestamp (epoch seconds or naive UTC ISO string) to epoch seconds."""
+    timestamp = msg.get("timestamp")
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    if isinstance(timestamp, str):
+        parsed = datetime.fromisoformat(timestamp)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=UTC)
+        return parsed.timestamp()
+    return 0.0
+
+
+def merge_conversation(
+    short_term: List[Dict[str, Any]], long_term: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Merge short-term and long-term conversation, both oldest first, by timestamp.
+
+    A message is dropped when the other source already had the same role and
+    content within MEMORY_DEDUPE_WINDOW_SECONDS, so a recent turn stored in
+    both shows up once. Repeats within one source are kept.
+    """
+    merged = heapq.merge(
+        ((_timestamp_value(msg), "short", msg) for msg in short_term),
+        ((_timestamp_value(msg), "long", msg) for msg in long_term),
+        key=lambda item: item[0]
+    )
+    last_seen = {}
+    conversation = []
+    for timestamp, source, msg in merged:
+        key = (msg["role"], msg["content"])
+        previous = last_seen.get(key)
+        if previous and previous[1] != source and timestamp - previous[0] <= MEMORY_DEDUPE_WINDOW_SECONDS:
+            continue
+        last_seen[key] = (timestamp, source)
+        conversation.append(msg)
+    return conversation
+
+
+def combine_memory(
+    short_term: List[Dict[str, Any]], long_term: List[Dict[str, Any]], notifications: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """Notifications followed by the merged, deduplicated conversation."""
+    return notifications + merge_conversation(short_term, long_term)
+
+
 class MemoryManager:
     """Manage short-term (Redis) and long-term (MongoDB) memory."""
     
@@ -20,30 +78,41 @@ class MemoryManager:
             self._redis = get_redis()
         return self._redis
     
+    def short_term_key(self, customer_id: str) -> str:
+        return f"memory:short:{customer_id}"
+    
     async def get_short_term_memory(
-        self, customer_id: str
+        self, customer_id: str, limit: Optional[int] = None
     ) -> List[Dict[str, Any]]:
-        """Get short-term memory from Redis."""
+        """Get short-term memory from Redis, only the last `limit` messages if given."""
         try:
-            key = f"memory:short:{customer_id}"
-            data = await self.redis.get(key)
-            if data:
-                return json.loads(data)
-            return []
+            key = self.short_term_key(customer_id)
+            start = -limit if limit else 0
+            try:
+                items = await self.redis.lrange(key, start, -1)
+            except ResponseError as e:
+                if "WRONGTYPE" not in str(e):
+                    raise
+                await self.migrate_short_term_key(key)
+                items = await self.redis.lrange(key, start, -1)
+            return [json.loads(item) for item in items]
         except Exception:
             return []
     
     async def set_short_term_memory(
         self, customer_id: str, messages: List[Dict[str, Any]]
     ):
-        """Set short-term memory in Redis."""
+        """Replace short-term memory in Redis."""
         try:
-            key = f"memory:short:{customer_id}"
+            key = self.short_term_key(customer_id)
             # Keep only recent messages
             recent_messages = messages[-settings.max_conversation_history:]
-            await self.redis.setex(
-                key, self.short_term_ttl, json.dumps(recent_messages)
-            )
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(key)
+                if recent_messages:
+                    pipe.rpush(key, *[json.dumps(msg) for msg in recent_messages])
+                    pipe.expire(key, self.short_term_ttl)
+                await pipe.execute()
         except Exception:
             pass
     
@@ -51,38 +120,98 @@ class MemoryManager:
         self, customer_id: str, message: Dict[str, Any]
     ):
         """Add message to short-term memory."""
+        await self.add_many_to_short_term_memory(customer_id, [message])
+    
+    async def add_many_to_short_term_memory(
+        self, customer_id: str, messages: List[Dict[str, Any]]
+    ):
+        """
+        Append messages to short-term memory in one round trip.
+        
+        RPUSH + LTRIM + EXPIRE run in a single MULTI pipeline, so appends are
+        O(1) in the history size and concurrent appends never drop messages.
+        """
         try:
-            current_memory = await self.get_short_term_memory(customer_id)
-            current_memory.append(message)
-            await self.set_short_term_memory(customer_id, current_memory)
+            key = self.short_term_key(customer_id)
+            items = [json.dumps(msg) for msg in messages]
+            try:
+                await self._append_short_term(key, items)
+            except ResponseError as e:
+                if "WRONGTYPE" not in str(e):
+                    raise
+                await self.migrate_short_term_key(key)
+                await self._append_short_term(key, items)
         except Exception:
             pass
     
+    async def _append_short_term(self, key: str, items: List[str]):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, *items)
+            pipe.ltrim(key, -settings.max_conversation_history, -1)
+            pipe.expire(key, self.short_term_ttl)
+            await pipe.execute()
+    
+    async def migrate_short_term_key(self, key: str):
+        """
+        Convert a legacy JSON string short-term memory key into a Redis list.
+        
+        The key is watched so a concurrent migration or append makes this
+        attempt back off instead of overwriting newer data.
+        """
+        async with self.redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(key)
+                if await pipe.type(key) != "string":
+                    return
+                data = await pipe.get(key)
+                ttl = await pipe.ttl(key)
+                messages = json.loads(data)[-settings.max_conversation_history:] if data else []
+                pipe.multi()
+                pipe.delete(key)
+                if messages:
+                    pipe.rpush(key, *[json.dumps(msg) for msg in messages])
+                    pipe.expire(key, ttl if ttl > 0 else self.short_term_ttl)
+                await pipe.execute()
+            except WatchError:
+                pass
+    
+    async def migrate_legacy_short_term_memory(self) -> int:
+        """Migrate every legacy memory:short:* string key to the list format."""
+        migrated = 0
+        async for key in self.redis.scan_iter(match="memory:short:*", count=1000, _type="string"):
+            await self.migrate_short_term_key(key)
+            migrated += 1
+        return migrated
+    
     async def get_long_term_memory(
-        self, customer_id: str, limit: int = 50
+        self, customer_id: str, limit: int = 50, exclude_system: bool = False
     ) -> List[Dict[str, Any]]:
         """Get long-term memory from MongoDB."""
         try:
-            Message = get_message()
-            # Get recent messages from database
-            messages = await Message.find(
-                {"customer": ObjectId(customer_id)}
-            ).sort("created_at", -1).limit(limit).to_list(length=limit)
-            
-            # Convert to dict format
-            memory = []
-            for msg in reversed(messages):  # Oldest first
-                memory.append({
-                    "role": msg.role,
-                    "content": msg.content,
-                    "timestamp": msg.created_at.isoformat(),
-                    "message_type": msg.message_type
-                })
-            
-            return memory
+            query = {"customer": ObjectId(customer_id)}
+            if exclude_system:
+                query["message_type"] = {"$ne": "system"}
+            return await self._find_memory_messages(query, limit)
         except Exception:
             return []
     
+    async def _find_memory_messages(
+        self, query: Dict[str, Any], limit: int
+    ) -> List[Dict[str, Any]]:
+        """Read the newest messages as raw projected documents, returned oldest first."""
+        Message = get_message()
+        cursor = Message.collection.find(query, MEMORY_PROJECTION).sort("created_at", -1).limit(limit)
+        messages = await cursor.to_list(length=limit)
+        return [
+            {
+                "role": msg["role"],
+                "content": msg["content"],
+                "timestamp": msg["created_at"].isoformat(),
+                "message_type": msg["message_type"]
+            }
+            for msg in reversed(messages)  # Oldest first
+        ]
+    
     async def add_to_long_term_memory(
         self, customer_id: str, chat_id: str, message: Dict[str, Any]
     ):
@@ -110,19 +239,9 @@ class MemoryManager:
     ) -> List[Dict[str, Any]]:
         """Get recent 'system' messages (notification) for a customer from MongoDB."""
         try:
-            Message = get_message()
-            messages = await Message.find(
-                {"customer": ObjectId(customer_id), "message_type": "system"}
-            ).sort("created_at", -1).limit(limit).to_list(length=limit)
-            return [
-                {
-                    "role": msg.role,
-                    "content": msg.content,
-                    "timestamp": msg.created_at.isoformat(),
-                    "message_type": msg.message_type
-                }
-                for msg in reversed(messages)
-            ]
+            return await self._find_memory_messages(
+                {"customer": ObjectId(customer_id), "message_type": "system"}, limit
+            )
         except Exception:
             return []
 
@@ -132,31 +251,25 @@ class MemoryManager:
         """
         Lấy short-term (chat gần nhất), long-term (history hội thoại), VÀ notification (system message gần nhất)
         """
-        # Short-term chứa cả user và ai
-        short_term = await self.get_short_term_memory(customer_id)
-        
-        # Long-term chỉ lấy message user/ai (không lấy system)
-        long_term = await self.get_long_term_memory(customer_id, limit=conversation_limit)
+        # Ba nguồn độc lập nên được đọc song song
+        short_term, long_term, notifications = await asyncio.gather(
+            # Short-term chứa cả user và ai
+            self.get_short_term_memory(customer_id, limit=short_term_limit),
+            # Long-term chỉ lấy message user/ai (không lấy system)
+            self.get_long_term_memory(customer_id, limit=conversation_limit, exclude_system=True),
+            # Notification là 10 cái system gần nhất
+            self.get_recent_notifications(customer_id, limit=notification_limit)
+        )
         
-        # Notification là 10 cái system gần nhất
-        notifications = await self.get_recent_notifications(customer_id, limit=notification_limit)
-        # Gộp lại, loại trùng (dựa trên content + type + timestamp)
-        combined = short_term[-short_term_limit:] + notifications + long_term
-
-        seen = set()
-        unique_memory = []
-        for msg in combined:
-            key = f"{msg['content']}_{msg.get('timestamp')}_{msg.get('message_type')}"
-            if key not in seen:
-                seen.add(key)
-                unique_memory.append(msg)
-        return unique_memory
+        # Hội thoại short-term và long-term đều đã theo thứ tự thời gian, trộn theo
+        # timestamp và loại các lượt có mặt ở cả hai nguồn
+        return combine_memory(short_term, long_term, notifications)
 
     
     async def clear_short_term_memory(self, customer_id: str):
         """Clear short-term memory for a customer."""
         try:
-            key = f"memory:short:{customer_id}"
+            key = self.short_term_key(customer_id)
             await self.redis.delete(key)
         except Exception:
             pass
@@ -164,15 +277,16 @@ class MemoryManager:
     async def get_memory_stats(self, customer_id: str) -> Dict[str, Any]:
         """Get memory statistics for a customer."""
         try:
-            short_term = await self.get_short_term_memory(customer_id)
+            Message = get_message()
+            short_term_count = await self.redis.llen(self.short_term_key(customer_id))
             long_term_count = await Message.count_documents(
-                {"customer": customer_id}
+                {"customer": ObjectId(customer_id)}
             )
             
             return {
-                "short_term_count": len(short_term),
+                "short_term_count": short_term_count,
                 "long_term_count": long_term_count,
-                "total_memory": len(short_term) + long_term_count
+                "total_memory": short_term_count + long_term_count
             }
         except Exception:
             return {
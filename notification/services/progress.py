@@ -0,0 +1,334 @@
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Dict, Any, Optional, Set
+from pymongo import ReturnDocument
+from config.database import get_redis
+from config.settings import settings
+from models import get_task
+
+
+# Task fields published to progress subscribers
+PROGRESS_FIELDS = {
+    "_id": 0, "job_id": 1, "status": 1, "progress": 1, "total_items": 1,
+    "processed_items": 1, "failed_items": 1, "shard_count": 1, "completed_shards": 1,
+    "failed_shards": 1
+}
+PROGRESS_CHANNEL_PREFIX = "task:progress:"
+# How long a new subscriber waits for the shared subscription to be confirmed
+SUBSCRIBE_TIMEOUT_SECONDS = 5
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+
+def progress_channel(job_id: str) -> str:
+    """Redis pub/sub channel carrying live progress of a task."""
+    return f"{PROGRESS_CHANNEL_PREFIX}{job_id}"
+
+
+def cancel_key(job_id: str) -> str:
+    """Redis key whose presence asks the workers running a task to stop."""
+    return f"task:cancel:{job_id}"
+
+
+class TaskCancelled(Exception):
+    """Raised inside a task once cancellation of it or its parent was requested."""
+
+
+async def request_cancel(job_id: str):
+    """Ask the workers running a task, or its shards, to stop after their current batch."""
+    await get_redis().set(cancel_key(job_id), "1", ex=settings.task_cancel_ttl)
+
+
+class ProgressReporter:
+    """
+    Throttled progress bookkeeping for a running Task.
+
+    Counts are accumulated in memory and written with $inc/$set partial
+    updates at most every progress_min_interval seconds or progress_min_delta
+    of progress, instead of a full document commit per batch. Every write is
+    also published to the task's Redis channel, and shard counts are rolled
+    up into the parent task on the same schedule.
+    """
+
+    def __init__(self, task_obj, parent_job_id: Optional[str] = None):
+        self.job_id = task_obj.job_id
+        self.parent_job_id = parent_job_id
+        self.total_items = task_obj.total_items or 0
+        self.processed_items = task_obj.processed_items or 0
+        self.failed_items = task_obj.failed_items or 0
+        self.progress = task_obj.progress or 0.0
+        self.min_interval = settings.progress_min_interval
+        self.min_delta = settings.progress_min_delta
+        self._pending_processed = 0
+        self._pending_failed = 0
+        self._flushed_at = time.monotonic()
+        self._flushed_progress = self.progress
+
+    async def start(self):
+        """
+        Mark the task running, raising TaskCancelled if it was cancelled first.
+
+        A task cancelled while still pending keeps its cancelled status.
+        """
+        task = await self._update(
+            {"$set": {"status": "running", "started_at": datetime.now()}},
+            {"status": {"$ne": "cancelled"}}
+        )
+        if task is None:
+            raise TaskCancelled(f"Task {self.job_id} was cancelled before it started")
+
+    async def set_total(self, total_items: int):
+        """Record the number of items the task will process."""
+        self.total_items = total_items
+        await self._update({"$set": {"total_items": total_items}})
+
+    async def advance(self, processed: int = 0, failed: int = 0, seen: Optional[int] = None):
+        """
+        Count processed and failed items, writing them out when the throttle allows.
+
+        Args:
+            processed: Items processed successfully since the last call
+            failed: Items failed since the last call
+            seen: Items consumed so far, when it differs from processed + failed
+        """
+        self.processed_items += processed
+        self.failed_items += failed
+        self._pending_processed += processed
+        self._pending_failed += failed
+        if seen is None:
+            seen = self.processed_items + self.failed_items
+        self.progress = min(seen / self.total_items, 1.0) if self.total_items else 1.0
+
+        if (
+            time.monotonic() - self._flushed_at >= self.min_interval
+            or self.progress - self._flushed_progress >= self.min_delta
+        ):
+            await self.flush()
+
+    async def flush(self, extra: Optional[Dict[str, Any]] = None, shard_finished: bool = False,
+                    error_message: Optional[str] = None):
+        """Write pending counts and progress in one partial update."""
+        update = {"$set": {"progress": self.progress, **(extra or {})}}
+        if self._pending_processed or self._pending_failed:
+            update["$inc"] = {
+                "processed_items": self._pending_processed,
+                "failed_items": self._pending_failed
+            }
+        await self._update(update)
+
+        if self.parent_job_id:
+            await self._roll_up_parent(shard_finished, error_message)
+        self._pending_processed = 0
+        self._pending_failed = 0
+        self._flushed_at = time.monotonic()
+        self._flushed_progress = self.progress
+
+    async def complete(self, result: Dict[str, Any]):
+        """Flush remaining counts and mark the task completed."""
+        self.progress = 1.0
+        await self.flush(
+            {"status": "completed", "completed_at": datetime.now(), "result": result},
+            shard_finished=True
+        )
+
+    async def fail(self, error_message: str, result: Optional[Dict[str, Any]] = None):
+        """Flush remaining counts and mark the task failed."""
+        extra = {"status": "failed", "error_message": error_message, "completed_at": datetime.now()}
+        if result is not None:
+            extra["result"] = result
+        await self.flush(
+            extra, shard_finished=True,
+            error_message=f"Shard {self.job_id} failed: {error_message}"
+        )
+
+    async def cancel(self, result: Dict[str, Any]):
+        """Flush the partial counts and mark the task cancelled."""
+        await self.flush(
+            {"status": "cancelled", "completed_at": datetime.now(), "result": result},
+            shard_finished=True
+        )
+
+    async def raise_if_cancelled(self):
+        """
+        Raise TaskCancelled if this task or its parent was cancelled.
+
+        One EXISTS round trip, cheap enough to call between batches.
+        """
+        keys = [cancel_key(self.job_id)]
+        if self.parent_job_id:
+            keys.append(cancel_key(self.parent_job_id))
+        try:
+            cancelled = await get_redis().exists(*keys)
+        except Exception as e:
+            print(f"[TASK] Cancellation check failed for {self.job_id}: {e}")
+            return
+        if cancelled:
+            raise TaskCancelled(f"Task {self.job_id} was cancelled")
+
+    async def _update(self, update: Dict[str, Any], condition: Optional[Dict[str, Any]] = None):
+        Task = get_task()
+        update.setdefault("$set", {})["updated_at"] = datetime.now()
+        task = await Task.collection.find_one_and_update(
+            {"job_id": self.job_id, **(condition or {})}, update,
+            projection=PROGRESS_FIELDS, return_document=ReturnDocument.AFTER
+        )
+        if task:
+            await publish_progress(task)
+        return task
+
+    async def _roll_up_parent(self, shard_finished: bool, error_message: Optional[str]):
+        """
+        Add this shard's pending counts to its parent in a single pipeline update.
+
+        Progress is recomputed server side. Once every shard has finished the
+        parent is marked completed, or failed with a "partial" result if any
+        shard failed.
+        """
+        Task = get_task()
+        now = datetime.now()
+        counters = {
+            "processed_items": {"$add": ["$processed_items", self._pending_processed]},
+            "failed_items": {"$add": ["$failed_items", self._pending_failed]},
+            "completed_shards": {"$add": ["$completed_shards", 1 if shard_finished else 0]},
+            "failed_shards": {"$add": [{"$ifNull": ["$failed_shards", 0]}, 1 if error_message else 0]},
+            "updated_at": now
+        }
+        if error_message:
+            counters["error_message"] = error_message
+        all_done = {"$gte": ["$completed_shards", "$shard_count"]}
+        is_cancelled = {"$eq": ["$status", "cancelled"]}
+        any_failed = {"$gt": ["$failed_shards", 0]}
+        pipeline = [
+            {"$set": counters},
+            {"$set": {
+                "progress": {"$cond": [
+                    {"$gt": ["$total_items", 0]},
+                    {"$min": [1.0, {"$divide": [{"$add": ["$processed_items", "$failed_items"]}, "$total_items"]}]},
+                    0.0
+                ]},
+                # A cancelled parent stays cancelled once its shards have stopped
+                "status": {"$cond": [
+                    {"$and": [all_done, {"$not": [is_cancelled]}]},
+                    {"$cond": [any_failed, "failed", "completed"]},
+                    "$status"
+                ]},
+                "completed_at": {"$cond": [all_done, {"$ifNull": ["$completed_at", now]}, "$completed_at"]},
+                "result": {"$cond": [all_done, {
+                    "status": {"$switch": {"branches": [
+                        {"case": is_cancelled, "then": "cancelled"},
+                        {"case": {"$gte": ["$failed_shards", "$shard_count"]}, "then": "failed"},
+                        {"case": any_failed, "then": "partial"}
+                    ], "default": "completed"}},
+                    "total_customers": "$total_items",
+                    "sent": "$processed_items",
+                    "failed": "$failed_items",
+                    "shards": "$shard_count",
+                    "failed_shards": "$failed_shards"
+                }, "$result"]}
+            }}
+        ]
+        parent = await Task.collection.find_one_and_update(
+            {"job_id": self.parent_job_id}, pipeline,
+            projection=PROGRESS_FIELDS, return_document=ReturnDocument.AFTER
+        )
+        if parent:
+            await publish_progress(parent)
+
+
+async def publish_progress(task: Dict[str, Any]):
+    """Publish a task's progress snapshot, never failing the task itself."""
+    try:
+        await get_redis().publish(progress_channel(task["job_id"]), json.dumps(task, default=str))
+    except Exception as e:
+        print(f"[TASK] Failed to publish progress of {task.get('job_id')}: {e}")
+
+
+class ProgressBroadcaster:
+    """
+    Fan-out of task progress messages inside one API process.
+
+    A single pattern subscription on task:progress:* is shared by every
+    listening client; each client gets its own bounded queue. Slow clients
+    lose the oldest snapshots, which are superseded by newer ones anyway.
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._listener: Optional[asyncio.Task] = None
+        # Set while Redis has confirmed the pattern subscription
+        self._subscribed = asyncio.Event()
+
+    @asynccontextmanager
+    async def subscribe(self, job_id: str):
+        """
+        Yield a queue receiving the progress snapshots published for a task.
+
+        Only yields once Redis has confirmed the shared subscription, so a
+        snapshot read afterwards cannot miss an update published in between.
+        If the confirmation does not arrive within SUBSCRIBE_TIMEOUT_SECONDS
+        the queue is yielded anyway and updates arrive once it does.
+        """
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        try:
+            try:
+                await asyncio.wait_for(self._subscribed.wait(), timeout=SUBSCRIBE_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                print(f"[PROGRESS] Subscription not confirmed yet, streaming {job_id} anyway")
+            yield queue
+        finally:
+            queues = self._subscribers.get(job_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[job_id]
+
+    async def _listen(self):
+        while True:
+            pubsub = get_redis().pubsub()
+            try:
+                await pubsub.psubscribe(f"{PROGRESS_CHANNEL_PREFIX}*")
+                async for message in pubsub.listen():
+                    if message["type"] == "psubscribe":
+                        self._subscribed.set()
+                        continue
+                    if message["type"] != "pmessage":
+                        continue
+                    job_id = message["channel"][len(PROGRESS_CHANNEL_PREFIX):]
+                    queues = self._subscribers.get(job_id)
+                    if queues:
+                        self._dispatch(queues, json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[PROGRESS] Subscription lost, reconnecting: {e}")
+                await asyncio.sleep(1)
+            finally:
+                self._subscribed.clear()
+                await pubsub.aclose()
+
+    def _dispatch(self, queues: Set[asyncio.Queue], snapshot: Dict[str, Any]):
+        for queue in list(queues):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(snapshot)
+
+    async def close(self):
+        """Stop the shared subscription."""
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._listener = None
+            self._subscribed.clear()
+
+
+# Global progress broadcaster instance
+progress_broadcaster = ProgressBroadcaster()
@@ -0,0 +1,272 @@
+import time
+import uuid
+from datetime import datetime, timedelta, UTC
+from typing import List, Dict, Any, Optional
+from pymongo import UpdateOne
+from redis.exceptions import ResponseError
+from config.database import get_redis
+from models import get_message, get_notification_report
+
+
+# Report scopes and the message field each one is keyed by
+REPORT_SCOPES = ("day", "config", "customer")
+DAY_SCOPE_KEY = "all"
+# Document marking that the counters cover all history
+BACKFILL_MARKER = {"scope": "backfill", "key": DAY_SCOPE_KEY, "date": DAY_SCOPE_KEY}
+FLUSH_BATCH_SIZE = 1000
+# A snapshot whose flush made no progress for this long is assumed abandoned
+FLUSH_STALE_SECONDS = 600
+
+
+def report_date(when: Optional[datetime] = None) -> str:
+    """UTC day bucket of a timestamp, e.g. 2024-01-31."""
+    return (when or datetime.now(UTC)).strftime("%Y-%m-%d")
+
+
+class ReportCounters:
+    """
+    Incrementally maintained message counters for the reports flow.
+
+    Every written message increments per-day, per-config and per-customer
+    counters in Redis pending hashes (fields "<key>|<date>|<message_type>").
+    flush() periodically moves them into the notification_reports collection,
+    one document per (scope, key, date), and reconcile() recomputes a day
+    from the raw messages so lost increments do not accumulate.
+    """
+
+    def __init__(self):
+        self._redis = None
+        self._backfilled = False
+
+    @property
+    def redis(self):
+        """Lazy initialization of Redis connection."""
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    def _pending_key(self, scope: str) -> str:
+        return f"reports:pending:{scope}"
+
+    async def record_messages(
+        self,
+        message_type: str,
+        customer_ids: List[Any],
+        notification_config_id: Optional[str] = None
+    ):
+        """
+        Count messages of one type written for the given customers, one per id.
+
+        Counter failures are logged and never fail the write they count.
+        """
+        if not customer_ids:
+            return
+        date = report_date()
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hincrby(self._pending_key("day"), f"{DAY_SCOPE_KEY}|{date}|{message_type}", len(customer_ids))
+                if notification_config_id:
+                    pipe.hincrby(
+                        self._pending_key("config"),
+                        f"{notification_config_id}|{date}|{message_type}",
+                        len(customer_ids)
+                    )
+                for customer_id in customer_ids:
+                    pipe.hincrby(self._pending_key("customer"), f"{customer_id}|{date}|{message_type}", 1)
+                await pipe.execute()
+        except Exception as e:
+            print(f"[REPORTS] Failed to record {message_type} counters: {e}")
+
+    def _snapshots_key(self, scope: str) -> str:
+        return f"reports:flushing:{scope}"
+
+    async def _claim(self, scope: str, source: str) -> Optional[str]:
+        """
+        Take ownership of a counter hash by renaming it to a fresh snapshot key.
+
+        The snapshot is registered with a timestamp before the rename, so a
+        crash never leaves an unregistered snapshot behind. RENAME is atomic:
+        of several flushes claiming the same key only one succeeds.
+
+        Returns:
+            The snapshot key, None if the source no longer exists
+        """
+        snapshots_key = self._snapshots_key(scope)
+        target = f"reports:flushing:{scope}:{uuid.uuid4().hex}"
+        await self.redis.zadd(snapshots_key, {target: time.time()})
+        try:
+            await self.redis.rename(source, target)
+        except ResponseError:
+            await self.redis.zrem(snapshots_key, target)
+            return None
+        return target
+
+    async def flush(self) -> int:
+        """
+        Move pending counters into notification_reports.
+
+        Each pending hash is renamed to a snapshot key owned by this flush, so
+        new increments go to a fresh hash and concurrent flushes never apply
+        the same snapshot. Snapshots of flushes that stopped making progress
+        for FLUSH_STALE_SECONDS are claimed the same way and applied again.
+
+        Returns:
+            Number of counter fields flushed
+        """
+        flushed = 0
+        for scope in REPORT_SCOPES:
+            snapshots_key = self._snapshots_key(scope)
+            owned = []
+            snapshot = await self._claim(scope, self._pending_key(scope))
+            if snapshot:
+                owned.append(snapshot)
+            stale = await self.redis.zrangebyscore(snapshots_key, 0, time.time() - FLUSH_STALE_SECONDS)
+            for stale_key in stale:
+                snapshot = await self._claim(scope, stale_key)
+                await self.redis.zrem(snapshots_key, stale_key)
+                if snapshot:
+                    print(f"[REPORTS] Claimed abandoned snapshot {stale_key}")
+                    owned.append(snapshot)
+            for snapshot in owned:
+                flushed += await self._flush_hash(scope, snapshot)
+        return flushed
+
+    async def _flush_hash(self, scope: str, flushing_key: str) -> int:
+        Report = get_notification_report()
+        snapshots_key = self._snapshots_key(scope)
+        flushed = 0
+        operations = []
+        async for field, value in self.redis.hscan_iter(flushing_key, count=FLUSH_BATCH_SIZE):
+            key, date, message_type = field.rsplit("|", 2)
+            operations.append(UpdateOne(
+                {"scope": scope, "key": key, "date": date},
+                {
+                    "$inc": {f"counts.{message_type}": int(value)},
+                    "$set": {"updated_at": datetime.now(UTC)}
+                },
+                upsert=True
+            ))
+            if len(operations) >= FLUSH_BATCH_SIZE:
+                await Report.collection.bulk_write(operations, ordered=False)
+                flushed += len(operations)
+                operations = []
+                # Progress keeps the snapshot from being claimed as abandoned
+                await self.redis.zadd(snapshots_key, {flushing_key: time.time()}, xx=True)
+        if operations:
+            await Report.collection.bulk_write(operations, ordered=False)
+            flushed += len(operations)
+        await self.redis.delete(flushing_key)
+        await self.redis.zrem(snapshots_key, flushing_key)
+        return flushed
+
+    async def get_counts(self, scope: str, key: str = DAY_SCOPE_KEY) -> Dict[str, Dict[str, int]]:
+        """
+        Get per-day counts of one scope key, including not yet flushed increments.
+
+        Reads one report document per day plus an HSCAN of the scope's
+        pending hash, so cost grows with the days covered and the fields
+        pending, not with the number of messages.
+
+        Args:
+            scope: "day" or "config"
+            key: Config id for the config scope
+
+        Returns:
+            Dict mapping day to {message_type: count}
+        """
+        Report = get_notification_report()
+        query = {"scope": scope, "key": key}
+
+        days = {}
+        async for doc in Report.collection.find(query, {"_id": 0, "date": 1, "counts": 1}):
+            days[doc["date"]] = dict(doc.get("counts", {}))
+
+        async for field, value in self.redis.hscan_iter(self._pending_key(scope), match=f"{key}|*"):
+            _, date, message_type = field.rsplit("|", 2)
+            counts = days.setdefault(date, {})
+            counts[message_type] = counts.get(message_type, 0) + int(value)
+        return days
+
+    async def reconcile(self, date: Optional[str] = None):
+        """
+        Recompute the counters of one day, or of all history, from the raw messages.
+
+        Each scope is one server-side aggregation that $merges its buckets
+        into notification_reports, replacing the incrementally built counts.
+        Pending counters should be flushed first so they are not added on
+        top of the recomputed values afterwards.
+        """
+        Message = get_message()
+        Report = get_notification_report()
+        # $merge needs the unique (scope, key, date) index to exist
+        await Report.ensure_indexes()
+
+        match = {}
+        if date is not None:
+            start = datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=UTC)
+            match = {"created_at": {"$gte": start, "$lt": start + timedelta(days=1)}}
+        now = datetime.now(UTC)
+        group_keys = {
+            "day": {"$literal": DAY_SCOPE_KEY},
+            "config": "$metadata.notification_config_id",
+            "customer": {"$toString": "$customer"}
+        }
+        for scope in REPORT_SCOPES:
+            pipeline = [
+                {"$match": match},
+                {"$group": {
+                    "_id": {
+                        "key": group_keys[scope],
+                        "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+                        "type": "$message_type"
+                    },
+                    "count": {"$sum": 1}
+                }},
+                {"$match": {"_id.key": {"$ne": None}}},
+                {"$group": {
+                    "_id": {"key": "$_id.key", "date": "$_id.date"},
+                    "counts": {"$push": {"k": "$_id.type", "v": "$count"}}
+                }},
+                {"$project": {
+                    "_id": 0,
+                    "scope": {"$literal": scope},
+                    "key": "$_id.key",
+                    "date": "$_id.date",
+                    "counts": {"$arrayToObject": "$counts"},
+                    "updated_at": {"$literal": now},
+                    "reconciled_at": {"$literal": now}
+                }},
+                {"$merge": {
+                    "into": Report.collection.name,
+                    "on": ["scope", "key", "date"],
+                    "whenMatched": "merge",
+                    "whenNotMatched": "insert"
+                }}
+            ]
+            await Message.collection.aggregate(pipeline).to_list(length=None)
+            print(f"[REPORTS] Reconciled {scope} counters for {date or 'all dates'}")
+
+    async def backfill(self):
+        """
+        Build the counters of all history once and mark them complete.
+
+        Until the marker exists, readers keep counting messages directly,
+        since the counters only cover messages written after the deploy.
+        """
+        Report = get_notification_report()
+        await self.flush()
+        await self.reconcile()
+        await Report.collection.update_one(
+            BACKFILL_MARKER, {"$set": {"updated_at": datetime.now(UTC)}}, upsert=True
+        )
+        self._backfilled = True
+
+    async def is_backfilled(self) -> bool:
+        """Whether backfill() has completed, cached once it has."""
+        if not self._backfilled:
+            Report = get_notification_report()
+            self._backfilled = await Report.collection.count_documents(BACKFILL_MARKER, limit=1) > 0
+        return self._backfilled
+
+# Global report counters instance
+report_counters = ReportCounters()
@@ -0,0 +1,95 @@
+import time
+from typing import Optional
+from bson import json_util
+from config.database import get_redis
+from config.settings import settings
+from models import get_user
+from utils.cache import TTLCache
+
+# Password hashes are only read by authenticate_user, never cached
+USER_CACHE_PROJECTION = {"hashed_password": 0}
+
+
+class UserCache:
+    """
+    Cache of authenticated users for get_current_user.
+
+    Entries are keyed by username plus the token's exp claim and never
+    outlive the token. The in-process LRU tier turns auth into a dict
+    lookup; the optional Redis tier shares loaded users between API
+    processes. Cached users carry no password hash. Entries are dropped
+    when a user is updated or deleted.
+    """
+
+    def __init__(self):
+        self._redis = None
+        self.local = TTLCache(settings.auth_cache_max_size, settings.auth_cache_ttl)
+
+    @property
+    def redis(self):
+        """Lazy initialization of Redis connection."""
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    def _key(self, username: str) -> str:
+        return f"auth:user:{username}"
+
+    async def get_user(self, username: str, exp: Optional[float] = None):
+        """Get a user by username, loading it from Redis or MongoDB on a miss."""
+        user = self.local.get((username, exp))
+        if user is not None:
+            return user
+
+        ttl = settings.auth_cache_ttl
+        if exp is not None:
+            ttl = min(ttl, exp - time.time())
+            if ttl <= 0:
+                return await self._load_user(username)
+
+        User = get_user()
+        user = None
+        if settings.auth_cache_redis_enabled:
+            try:
+                cached = await self.redis.get(self._key(username))
+                if cached:
+                    document = json_util.loads(cached)
+                    document.pop("hashed_password", None)  # Entries written before it was excluded
+                    user = User.build_from_mongo(document)
+            except Exception as e:
+                print(f"[AUTH] User cache read failed: {e}")
+
+        if user is None:
+            user = await self._load_user(username)
+            if user is None:
+                return None
+            if settings.auth_cache_redis_enabled:
+                try:
+                    await self.redis.set(
+                        self._key(username),
+                        json_util.dumps(user.to_mongo()),
+                        ex=settings.auth_cache_ttl
+                    )
+                except Exception as e:
+                    print(f"[AUTH] User cache write failed: {e}")
+
+        self.local.set((username, exp), user, ttl)
+        return user
+
+    async def _load_user(self, username: str):
+        User = get_user()
+        document = await User.collection.find_one({"username": username}, USER_CACHE_PROJECTION)
+        return User.build_from_mongo(document) if document else None
+
+    async def invalidate(self, username: str):
+        """Drop every cached entry of a user, e.g. after it was deactivated."""
+        self.local.pop_matching(lambda key: key[0] == username)
+        if settings.auth_cache_redis_enabled:
+            try:
+                await self.redis.delete(self._key(username))
+            except Exception as e:
+                print(f"[AUTH] User cache invalidation failed: {e}")
+
+
+# Global user cache instance
+user_cache = UserCache()
@@ -1,101 +1,565 @@
 import pandas as pd
+import asyncio
+import hashlib
+import itertools
+import json
+import multiprocessing
 import os
-from datetime import datetime
-from typing import Dict, Any
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from datetime import datetime, UTC
+from typing import Dict, Any, List, Optional, Tuple
 from taskiq import TaskiqDepends, Context
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from models import get_task
 from models import get_customer
-from taskiq_redis import RedisStreamBroker
 
 from config.settings import settings
+from utils.validators import validate_customer_frame, normalize_email, CUSTOMER_COLUMNS, REJECTION_REASON_COLUMN
+from utils.file_formats import (
+    detect_file_format, count_rows, open_customer_frames, read_customer_file,
+    available_cpus, plan_range_size, split_csv_ranges, parse_customer_range
+)
+from services.progress import ProgressReporter, TaskCancelled
+from services.context_cache import context_cache
 
 from worker import broker
 
+IMPORT_MODES = ("stream", "merge", "parallel", "row")
+DRY_RUN_SAMPLE_SIZE = 20
+_parse_pool: Optional[ProcessPoolExecutor] = None
+
 @broker.task
 async def import_customers_task(
     file_path: str,
     user_id: str,
+    import_mode: str = "stream",
+    dry_run: bool = False,
     context: Context = TaskiqDepends(),
 ) -> Dict[str, Any]:
     Task = get_task()
-    Customer = get_customer()
     job_id = context.message.task_id
     task_obj = await Task.find_one({"job_id": job_id})
     if not task_obj:
         raise Exception(f"Task {job_id} not found")
+    progress = ProgressReporter(task_obj)
 
     try:
-        task_obj.status = "running"
-        task_obj.started_at = datetime.now()
-        await task_obj.commit()
-        df = pd.read_csv(file_path)
-        total_rows = len(df)
-        task_obj.total_items = total_rows
-        await task_obj.commit()
-
-        def safe_str(val, default=''):
-            """Chuyển về str và strip, nếu NaN thì trả về default."""
-            if pd.isna(val):
-                return default
-            return str(val).strip()
-
-        for idx, (_, row) in enumerate(df.iterrows()):
-            try:
-                email = safe_str(row.get('email'))
-                full_name = safe_str(row.get('full_name'))
-                if not email or not full_name:
-                    task_obj.failed_items += 1
-                    print(f"[IMPORT] Row {idx+1} missing email or full_name: {row.to_dict()}")
-                    continue
-                existing = await Customer.find_one({"email": email})
-                if existing:
-                    task_obj.failed_items += 1
-                    print(f"[IMPORT] Row {idx+1} duplicate email: {email}")
-                    continue
-                customer_data = {
-                    "email": email,
-                    "full_name": full_name,
-                    "phone": safe_str(row.get('phone'), None),
-                    "company": safe_str(row.get('company'), None),
-                    "position": safe_str(row.get('position'), None),
-                    "address": safe_str(row.get('address'), None),
-                    "city": safe_str(row.get('city'), None),
-                    "country": safe_str(row.get('country'), None),
-                    "language": safe_str(row.get('language'), 'vi'),
-                    "tags": [tag.strip() for tag in str(row.get('tags') or '').split(',') if tag.strip()] if pd.notna(row.get('tags')) else []
-                }
-                customer = Customer(**customer_data)
-                await customer.commit()
-                task_obj.processed_items += 1
-                print(f"[IMPORT] Row {idx+1} imported: {customer_data['email']}")
-            except Exception as e:
-                task_obj.failed_items += 1
-                print(f"[IMPORT] Row {idx+1} error: {str(e)} -- {row.to_dict()}")
-            if (idx + 1) % 10 == 0:
-                task_obj.progress = (idx + 1) / total_rows
-                await task_obj.commit()
-
-        task_obj.progress = 1.0
-        task_obj.status = "completed"
-        task_obj.completed_at = datetime.now()
-        await task_obj.commit()
+        # A task cancelled while pending must not start running
+        await progress.raise_if_cancelled()
+        await progress.start()
+
+        file_format = detect_file_format(file_path)
+        if file_format is None:
+            raise ValueError("Unsupported import file format")
+
+        summary = {}
+        if dry_run:
+            total_rows, summary = await dry_run_stream(
+                file_path, file_format, progress, merge=import_mode == "merge"
+            )
+        elif import_mode == "row":
+            total_rows = await import_rows(file_path, file_format, progress)
+        elif import_mode == "parallel" and file_format == "csv":
+            total_rows = await import_parallel(file_path, progress)
+        else:
+            if import_mode == "parallel":
+                print(f"[IMPORT] {file_format} files cannot be split into byte ranges, importing as a stream")
+            total_rows, summary = await import_stream(
+                file_path, file_format, progress, merge=import_mode == "merge"
+            )
+
         try:
             os.remove(file_path)
         except Exception:
             pass
+        success_rate = (progress.processed_items / total_rows) * 100 if total_rows else 0
         result = {
             "status": "completed",
+            "file_format": file_format,
             "total_rows": total_rows,
-            "processed": task_obj.processed_items,
-            "failed": task_obj.failed_items,
-            "success_rate": f"{(task_obj.processed_items / total_rows) * 100:.1f}%"
+            "processed": progress.processed_items,
+            "failed": progress.failed_items,
+            "success_rate": f"{success_rate:.1f}%"
+        }
+        if dry_run:
+            result.update({"dry_run": True, "import_mode": import_mode, **summary})
+        elif import_mode == "merge":
+            result.update({key: summary[key] for key in ("created", "updated", "unchanged")})
+        await progress.complete(result)
+        return result
+    except TaskCancelled:
+        try:
+            os.remove(file_path)
+        except Exception:
+            pass
+        result = {
+            "status": "cancelled",
+            "processed": progress.processed_items,
+            "failed": progress.failed_items
         }
-        task_obj.result = result
-        await task_obj.commit()
+        await release_dedupe_key(job_id)
+        await progress.cancel(result)
+        print(f"[IMPORT] Import {job_id} cancelled: {result}")
         return result
     except Exception as e:
-        task_obj.status = "failed"
-        task_obj.error_message = str(e)
-        task_obj.completed_at = datetime.now()
-        await task_obj.commit()
+        await release_dedupe_key(job_id)
+        await progress.fail(str(e))
+        raise
+
+
+async def release_dedupe_key(job_id: str):
+    """Let the same file be uploaded again after this import failed or was cancelled."""
+    Task = get_task()
+    await Task.collection.update_one({"job_id": job_id}, {"$unset": {"dedupe_key": ""}})
+
+
+async def import_rows(file_path: str, file_format: str, progress: ProgressReporter) -> int:
+    """Import the whole file row by row with one duplicate check and commit per row."""
+    Customer = get_customer()
+    df = read_customer_file(file_path, file_format)
+    total_rows = len(df)
+    await progress.set_total(total_rows)
+
+    def safe_str(val, default=''):
+        """Chuyển về str và strip, nếu NaN thì trả về default."""
+        if pd.isna(val):
+            return default
+        return str(val).strip()
+
+    for idx, (_, row) in enumerate(df.iterrows()):
+        if idx % 10 == 0:
+            await progress.raise_if_cancelled()
+        try:
+            email = safe_str(row.get('email'))
+            full_name = safe_str(row.get('full_name'))
+            if not email or not full_name:
+                await progress.advance(failed=1)
+                print(f"[IMPORT] Row {idx+1} missing email or full_name: {row.to_dict()}")
+                continue
+            existing = await Customer.find_one({"email": email})
+            if existing:
+                await progress.advance(failed=1)
+                print(f"[IMPORT] Row {idx+1} duplicate email: {email}")
+                continue
+            customer_data = {
+                "email": email,
+                "full_name": full_name,
+                "phone": safe_str(row.get('phone'), None),
+                "company": safe_str(row.get('company'), None),
+                "position": safe_str(row.get('position'), None),
+                "address": safe_str(row.get('address'), None),
+                "city": safe_str(row.get('city'), None),
+                "country": safe_str(row.get('country'), None),
+                "language": safe_str(row.get('language'), 'vi'),
+                "tags": [tag.strip() for tag in str(row.get('tags') or '').split(',') if tag.strip()] if pd.notna(row.get('tags')) else []
+            }
+            customer = Customer(**customer_data)
+            await customer.commit()
+            await progress.advance(processed=1)
+            print(f"[IMPORT] Row {idx+1} imported: {customer_data['email']}")
+        except Exception as e:
+            await progress.advance(failed=1)
+            print(f"[IMPORT] Row {idx+1} error: {str(e)} -- {row.to_dict()}")
+
+    return total_rows
+
+
+async def import_stream(
+    file_path: str,
+    file_format: str,
+    progress: ProgressReporter,
+    merge: bool = False
+) -> Tuple[int, Dict[str, int]]:
+    """
+    Import the file in fixed-size chunks so memory stays constant.
+
+    Each chunk is validated with validate_customer_frame, then either
+    inserted with import_customer_chunk, skipping existing emails, or
+    upserted with merge_customer_chunk when merge is set.
+
+    Returns:
+        Tuple of (rows read, per-outcome row counts summed over all chunks)
+    """
+    total_rows = count_rows(file_path, file_format)
+    await progress.set_total(total_rows)
+
+    rows_seen = 0
+    summary: Dict[str, int] = {}
+    with open_customer_frames(file_path, file_format, settings.import_chunk_size) as frames:
+        for chunk in frames:
+            await progress.raise_if_cancelled()
+            counts = await (merge_customer_chunk(chunk) if merge else import_customer_chunk(chunk))
+            for key, value in counts.items():
+                summary[key] = summary.get(key, 0) + value
+            rows_seen += len(chunk)
+            processed = len(chunk) - counts["failed"]
+            await progress.advance(processed, counts["failed"], seen=rows_seen)
+            outcome = ", ".join(f"{value} {key}" for key, value in counts.items())
+            print(f"[IMPORT] {rows_seen}/{total_rows} rows: {outcome}")
+
+    if rows_seen != total_rows:
+        await progress.set_total(rows_seen)  # Newline counts over-count multiline CSV fields
+    return rows_seen, summary
+
+
+def parse_workers() -> int:
+    """Number of parser processes of this worker process."""
+    return settings.import_workers or available_cpus()
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """
+    Process pool shared by every parallel import of this worker process.
+
+    Concurrent imports queue their ranges on the same import_workers
+    processes instead of each spawning its own interpreters.
+    """
+    global _parse_pool
+    if _parse_pool is None:
+        # Spawned processes do not inherit the worker's event loop and client threads
+        _parse_pool = ProcessPoolExecutor(
+            max_workers=parse_workers(), mp_context=multiprocessing.get_context("spawn")
+        )
+    return _parse_pool
+
+
+async def shutdown_parse_pool():
+    """Stop the parser processes without blocking the event loop."""
+    global _parse_pool
+    if _parse_pool is not None:
+        pool, _parse_pool = _parse_pool, None
+        await asyncio.get_running_loop().run_in_executor(None, partial(pool.shutdown, cancel_futures=True))
+
+
+async def import_parallel(file_path: str, progress: ProgressReporter) -> int:
+    """
+    Import a plain CSV file with parsing and validation spread over processes.
+
+    The file is split into byte ranges aligned on line boundaries. Each range
+    is parsed and validated by parse_customer_range in the worker's shared
+    process pool while this coroutine writes the finished ranges, in file
+    order, with import_customer_chunk. At most two ranges per process are in
+    flight so memory stays bounded.
+    """
+    total_rows = count_rows(file_path, "csv")
+    await progress.set_total(total_rows)
+    workers = parse_workers()
+    header, ranges = split_csv_ranges(
+        file_path, plan_range_size(os.path.getsize(file_path), workers, settings.import_range_size)
+    )
+    print(f"[IMPORT] Parsing {len(ranges)} ranges on {workers} processes")
+
+    loop = asyncio.get_running_loop()
+    pool = get_parse_pool()
+    ranges = iter(ranges)
+    rows_seen = 0
+
+    def submit(byte_range):
+        start, end = byte_range
+        return loop.run_in_executor(pool, parse_customer_range, file_path, header, start, end)
+
+    pending = deque(submit(byte_range) for byte_range in itertools.islice(ranges, workers * 2))
+    try:
+        while pending:
+            chunk = await pending.popleft()
+            await progress.raise_if_cancelled()
+            next_range = next(ranges, None)
+            if next_range:
+                pending.append(submit(next_range))
+            counts = await import_customer_chunk(chunk, validated=True)
+            rows_seen += len(chunk)
+            await progress.advance(counts["imported"], counts["failed"], seen=rows_seen)
+            print(f"[IMPORT] {rows_seen}/{total_rows} rows: {counts['imported']} imported, {counts['failed']} failed")
+    except BrokenProcessPool:
+        # A crashed parser breaks the pool for good, the next import starts a new one
+        await shutdown_parse_pool()
         raise
+    finally:
+        # Queued ranges are dropped; ranges already parsing finish in the background
+        for future in pending:
+            future.cancel()
+
+    if rows_seen != total_rows:
+        await progress.set_total(rows_seen)  # Newline counts over-count multiline CSV fields
+    return rows_seen
+
+
+async def dry_run_stream(
+    file_path: str,
+    file_format: str,
+    progress: ProgressReporter,
+    merge: bool = False
+) -> Tuple[int, Dict[str, Any]]:
+    """
+    Validate the file like the real import would without writing anything.
+
+    Besides validate_customer_frame, rows are checked per chunk for phones
+    repeated in the chunk and, with one $in query each, for emails and
+    phones already in the database. The email query is projected to the
+    email only, which the email index answers without fetching documents.
+    In merge mode existing emails are updates rather than rejections, and
+    only phones held by another customer conflict.
+
+    Duplicates are only detected within a chunk and against the database,
+    so memory stays constant; a value repeated in a later chunk of the same
+    file is not reported.
+
+    Returns:
+        Tuple of (rows read, report with rejection counts by reason, a
+        sample of rejected rows and, in merge mode, the rows that would
+        update existing customers)
+    """
+    Customer = get_customer()
+    total_rows = count_rows(file_path, file_format)
+    await progress.set_total(total_rows)
+
+    rows_seen = 0
+    existing_rows = 0
+    rejections: Dict[str, int] = {}
+    sample: List[Dict[str, Any]] = []
+    with open_customer_frames(file_path, file_format, settings.import_chunk_size) as frames:
+        for chunk in frames:
+            await progress.raise_if_cancelled()
+            validated = validate_customer_frame(chunk)
+            email = validated['email']
+            phone = validated['phone']
+            reason = validated[REJECTION_REASON_COLUMN]
+            reason = reason.mask(reason.isna() & phone.notna() & phone.duplicated(), "duplicate_phone")
+
+            existing_emails = set()
+            cursor = Customer.collection.find(
+                {"email": {"$in": email[reason.isna()].tolist()}}, {"_id": 0, "email": 1}
+            )
+            async for doc in cursor:
+                existing_emails.add(doc["email"])
+            is_existing = reason.isna() & email.isin(existing_emails)
+            if merge:
+                existing_rows += int(is_existing.sum())
+            else:
+                reason = reason.mask(is_existing, "existing_email")
+
+            phone_owners = {}
+            cursor = Customer.collection.find(
+                {"phone": {"$in": phone[reason.isna() & phone.notna()].tolist()}},
+                {"_id": 0, "phone": 1, "email": 1}
+            )
+            async for doc in cursor:
+                phone_owners[doc["phone"]] = doc.get("email")
+            owner = phone.map(phone_owners)
+            taken = owner.notna() & (owner != email) if merge else owner.notna()
+            reason = reason.mask(reason.isna() & taken.fillna(False).astype(bool), "existing_phone")
+
+            rejected = reason.notna()
+            for key, count in reason[rejected].value_counts().items():
+                rejections[key] = rejections.get(key, 0) + int(count)
+            for position in rejected.to_numpy().nonzero()[0][:DRY_RUN_SAMPLE_SIZE - len(sample)]:
+                row = chunk.iloc[position]
+                sample.append({
+                    "row": rows_seen + int(position) + 1,
+                    "reason": reason.iloc[position],
+                    "data": {key: row[key] for key in CUSTOMER_COLUMNS if key in row and pd.notna(row[key])}
+                })
+
+            failed = int(rejected.sum())
+            rows_seen += len(chunk)
+            await progress.advance(len(chunk) - failed, failed, seen=rows_seen)
+            print(f"[IMPORT] Dry run {rows_seen}/{total_rows} rows: {failed} would be rejected")
+
+    report = {"rejections": rejections, "sample": sample}
+    if merge:
+        report["existing"] = existing_rows
+    if rows_seen != total_rows:
+        await progress.set_total(rows_seen)  # Newline counts over-count multiline CSV fields
+    return rows_seen, report
+
+
+async def import_customer_chunk(chunk: pd.DataFrame, validated: bool = False) -> Dict[str, int]:
+    """
+    Insert one chunk of customers, counting rejected rows as failed.
+
+    The chunk is validated first unless it already went through
+    validate_customer_frame, e.g. in a parser process.
+    """
+    Customer = get_customer()
+    if not validated:
+        chunk = validate_customer_frame(chunk)
+
+    rejected = chunk[REJECTION_REASON_COLUMN].notna()
+    valid = chunk[~rejected].drop(columns=REJECTION_REASON_COLUMN)
+    failed = int(rejected.sum())
+    if failed:
+        print(f"[IMPORT] Rejected rows: {chunk.loc[rejected, REJECTION_REASON_COLUMN].value_counts().to_dict()}")
+    if valid.empty:
+        return {"imported": 0, "failed": failed}
+
+    existing = set()
+    cursor = Customer.collection.find(
+        {"email": {"$in": valid['email'].tolist()}}, {"_id": 0, "email": 1}
+    )
+    async for doc in cursor:
+        existing.add(doc["email"])
+    if existing:
+        is_existing = valid['email'].isin(existing)
+        failed += int(is_existing.sum())
+        valid = valid[~is_existing]
+        if valid.empty:
+            return {"imported": 0, "failed": failed}
+
+    documents = build_customer_documents(valid)
+    try:
+        result = await Customer.collection.insert_many(documents, ordered=False)
+        imported = len(result.inserted_ids)
+    except BulkWriteError as e:
+        imported = e.details.get("nInserted", 0)
+        write_errors = e.details.get("writeErrors", [])
+        print(f"[IMPORT] {len(write_errors)} rows rejected on insert: {write_errors[:1]}")
+    failed += len(documents) - imported
+    return {"imported": imported, "failed": failed}
+
+
+def build_customer_documents(chunk: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Build raw customer documents, leaving unset fields out like umongo does."""
+    now = datetime.now(UTC)
+    documents = []
+    for record in chunk.to_dict("records"):
+        document = {key: value for key, value in record.items() if key == 'tags' or not pd.isna(value)}
+        document.update({
+            "is_active": True,
+            "metadata": {},
+            "created_at": now,
+            "updated_at": now
+        })
+        documents.append(document)
+    return documents
+
+
+def row_hash(changes: Dict[str, Any]) -> str:
+    """Content hash of the customer fields one import row sets."""
+    return hashlib.blake2b(json.dumps(changes, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+
+def provided_cells(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Mask of the customer cells present and non-empty in the source file."""
+    source = chunk.reindex(columns=CUSTOMER_COLUMNS)
+    return source.apply(lambda column: column.astype("string").str.strip().fillna("") != "")
+
+
+async def merge_customer_chunk(chunk: pd.DataFrame) -> Dict[str, int]:
+    """
+    Upsert one chunk of customers keyed on email.
+
+    Only cells present and non-empty in the source file are $set, so a file
+    without a tags or language column, or a blank cell, leaves the stored
+    value untouched; the language and tags defaults only apply to inserts.
+    Rows whose content hash matches the import_hash stored on the customer
+    are skipped without a write, looked up with one covered $in query on the
+    (email, import_hash, _id) index. Changed and new rows are written with
+    one unordered bulk_write of UpdateOne(upsert=True), after which the chat
+    contexts of the updated customers are invalidated.
+    """
+    Customer = get_customer()
+    provided = provided_cells(chunk)
+    chunk = validate_customer_frame(chunk)
+
+    rejected = chunk[REJECTION_REASON_COLUMN].notna()
+    valid = chunk[~rejected].drop(columns=REJECTION_REASON_COLUMN)
+    counts = {"created": 0, "updated": 0, "unchanged": 0, "failed": int(rejected.sum())}
+    if counts["failed"]:
+        print(f"[IMPORT] Rejected rows: {chunk.loc[rejected, REJECTION_REASON_COLUMN].value_counts().to_dict()}")
+    if valid.empty:
+        return counts
+
+    stored = {}
+    cursor = Customer.collection.find(
+        {"email": {"$in": valid['email'].tolist()}}, {"_id": 1, "email": 1, "import_hash": 1}
+    )
+    async for doc in cursor:
+        stored[doc["email"]] = doc
+
+    now = datetime.now(UTC)
+    operations = []
+    updated_ids = []
+    for index, record in zip(valid.index, valid.to_dict("records")):
+        changes = {
+            key: value for key, value in record.items()
+            if provided.at[index, key] and (value if key == 'tags' else not pd.isna(value))
+        }
+        import_hash = row_hash(changes)
+        existing = stored.get(record['email'])
+        if existing and existing.get("import_hash") == import_hash:
+            counts["unchanged"] += 1
+            continue
+        if existing:
+            updated_ids.append(existing["_id"])
+        on_insert = {"is_active": True, "metadata": {}, "created_at": now}
+        on_insert.update({key: value for key, value in (("language", "vi"), ("tags", [])) if key not in changes})
+        changes.update({"import_hash": import_hash, "updated_at": now})
+        operations.append(UpdateOne(
+            {"email": record['email']},
+            {"$set": changes, "$setOnInsert": on_insert},
+            upsert=True
+        ))
+    if not operations:
+        return counts
+
+    try:
+        result = await Customer.collection.bulk_write(operations, ordered=False)
+        details = result.bulk_api_result
+    except BulkWriteError as e:
+        details = e.details
+        write_errors = details.get("writeErrors", [])
+        print(f"[IMPORT] {len(write_errors)} rows rejected on merge: {write_errors[:1]}")
+    # Profile changes make cached chat contexts stale
+    await context_cache.invalidate(updated_ids)
+
+    created = details.get("nUpserted", 0)
+    matched = details.get("nMatched", 0)
+    modified = details.get("nModified", 0)
+    counts["created"] += created
+    counts["updated"] += modified
+    counts["unchanged"] += matched - modified
+    counts["failed"] += len(operations) - created - matched
+    return counts
+
+
+@broker.task
+async def normalize_customer_emails_task() -> Dict[str, Any]:
+    """
+    Lowercase and trim the emails of customers created before they were normalized.
+
+    Run once after deploying (kiq it from a shell). Customers whose
+    normalized email already belongs to another customer are left as they
+    are and reported, to be merged by hand.
+    """
+    Customer = get_customer()
+    query = {"$expr": {"$ne": ["$email", {"$toLower": {"$trim": {"input": "$email"}}}]}}
+    normalized = 0
+    conflicts = []
+    operations = []
+
+    async def write(operations):
+        try:
+            result = await Customer.collection.bulk_write(operations, ordered=False)
+            return result.modified_count
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                conflicts.append(error["op"]["q"]["email"])
+            return e.details.get("nModified", 0)
+
+    async for doc in Customer.collection.find(query, {"_id": 1, "email": 1}):
+        operations.append(UpdateOne(
+            {"_id": doc["_id"], "email": doc["email"]},
+            {"$set": {"email": normalize_email(doc["email"]), "updated_at": datetime.now(UTC)}}
+        ))
+        if len(operations) >= settings.import_chunk_size:
+            normalized += await write(operations)
+            operations = []
+    if operations:
+        normalized += await write(operations)
+
+    print(f"[IMPORT] Normalized {normalized} customer emails, {len(conflicts)} conflicts: {conflicts[:10]}")
+    return {"normalized": normalized, "conflicts": conflicts[:100], "conflict_count": len(conflicts)}
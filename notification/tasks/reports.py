@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta, UTC
+from typing import Dict, Any, Optional
+
+from config.settings import settings
+from services.report_counters import report_counters, report_date
+
+from worker import broker
+
+
+@broker.task(schedule=[{"cron": settings.report_flush_cron}])
+async def flush_report_counters_task() -> Dict[str, Any]:
+    """Flush pending Redis report counters into notification_reports."""
+    flushed = await report_counters.flush()
+    print(f"[REPORTS] Flushed {flushed} counters")
+    return {"flushed": flushed}
+
+
+@broker.task(schedule=[{"cron": settings.report_reconcile_cron}])
+async def reconcile_reports_task(date: Optional[str] = None) -> Dict[str, Any]:
+    """Recompute one day of report counters from messages, yesterday by default."""
+    if date is None:
+        date = report_date(datetime.now(UTC) - timedelta(days=1))
+    flushed = await report_counters.flush()
+    await report_counters.reconcile(date)
+    return {"date": date, "flushed": flushed}
+
+
+@broker.task
+async def backfill_reports_task() -> Dict[str, Any]:
+    """
+    Build report counters for all messages written before they were introduced.
+
+    Run once after deploying (kiq it from a shell); /notifications/stats
+    keeps counting messages directly until it has completed.
+    """
+    await report_counters.backfill()
+    print("[REPORTS] Backfill completed")
+    return {"status": "completed"}
@@ -1,18 +1,35 @@
-from datetime import datetime
-from typing import Dict, Any, List
+import uuid
+from contextlib import aclosing
+from datetime import datetime, UTC
+from typing import Dict, Any, List, Optional
 from taskiq import TaskiqDepends, Context
+from umongo import ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from models import get_customer, get_chat, get_message, get_notification_config, get_task
 from config.settings import settings
+from utils.templates import CompiledTemplate, get_compiled_template
+from services.context_cache import context_cache
+from services.report_counters import report_counters
+from services.progress import ProgressReporter, TaskCancelled
 from bson import ObjectId
 
 from worker import broker
 
+# Customer fields needed to render notifications
+AUDIENCE_PROJECTION = {"_id": 1, "full_name": 1, "email": 1, "company": 1, "language": 1}
+CUSTOMER_TEMPLATE_FIELDS = ("customer_name", "customer_email", "company")
+SEND_MODES = ("batch", "single")
+
 @broker.task
 async def send_notification_task(
     customer_ids: List[str],
     notification_config_id: str,
     data: Dict[str, Any],
     user_id: str,
+    send_mode: str = "batch",
+    id_range: Optional[Dict[str, Optional[str]]] = None,
+    parent_job_id: Optional[str] = None,
     context: Context = TaskiqDepends(),
 ) -> Dict[str, Any]:
     """
@@ -23,6 +40,9 @@ async def send_notification_task(
         notification_config_id: ID of notification config template
         data: Dynamic data for template rendering
         user_id: ID of user who initiated notification
+        send_mode: "batch" for bulk writes per chunk, "single" for per-customer commits
+        id_range: Optional {"gte", "lt"} customer _id bounds when sending to a shard of "all"
+        parent_job_id: Job ID of the parent task this shard reports progress to
         task: TaskIQ task dependency
     """
     # Get task record
@@ -30,12 +50,25 @@ async def send_notification_task(
     task_obj = await Task.find_one({"job_id": context.message.task_id})
     if not task_obj:
         raise Exception(f"Task {context.message.task_id} not found")
+    progress = ProgressReporter(task_obj, parent_job_id=parent_job_id)
+    seen_customers = 0
     
     try:
+        # A task cancelled while pending must not start running
+        await progress.raise_if_cancelled()
+        
         # Update task status to running
-        task_obj.status = "running"
-        task_obj.started_at = datetime.now()
-        await task_obj.commit()
+        await progress.start()
+        
+        # Large audiences are split into shards sent by parallel workers, this
+        # task then only tracks them and its record becomes their parent
+        if parent_job_id is None:
+            await progress.raise_if_cancelled()
+            shards = await plan_customer_shards(customer_ids, settings.notification_shard_size)
+            if len(shards) > 1:
+                return await enqueue_notification_shards(
+                    task_obj, shards, notification_config_id, data, user_id, send_mode
+                )
         
         # Get notification config
         NotificationConfig = get_notification_config()
@@ -43,88 +76,420 @@ async def send_notification_task(
         if not config:
             raise Exception(f"Notification config {notification_config_id} not found")
         
-        # Get customers to notify
+        # Bind the shared template data once, only customer fields are left per recipient
+        template = get_compiled_template(config).partial({
+            key: value for key, value in data.items() if key not in CUSTOMER_TEMPLATE_FIELDS
+        })
+        
+        # Build the audience query, customers are streamed from a cursor below
         Customer = get_customer()
         if customer_ids == ["all"]:
-            customers = await Customer.find({"is_active": True}).to_list()
+            query = {"is_active": True}
+            if id_range:
+                query["_id"] = customer_id_range_filter(id_range)
         else:
-            customers = await Customer.find({"_id": {"$in": [ObjectId(customer_id) for customer_id in customer_ids]}}).to_list(length=len(customer_ids))
+            query = {"_id": {"$in": [ObjectId(customer_id) for customer_id in customer_ids]}}
+        # Count the customers the query resolves to; shard tasks already know
+        # their size from planning
+        total_customers = task_obj.total_items or await Customer.collection.count_documents(query)
         
-        task_obj.total_items = len(customers)
-        await task_obj.commit()
+        await progress.set_total(total_customers)
         
-        print(f"[TASK] Sending chat notifications to {len(customers)} customers")
+        print(f"[TASK] Sending chat notifications to {total_customers} customers ({send_mode} mode)")
         
-        # Process each customer
-        for index, customer in enumerate(customers):
-            try:
-                # Get or create chat session
-                chat = await get_or_create_chat_session(str(customer.id))
-                
-                # Render notification content
-                notification_content = config.body_template.format(**data, **{
-                    "customer_name": customer.full_name,
-                    "customer_email": customer.email,
-                    "company": customer.company or "FTEL"
-                })
-                
-                # Create system message in chat
-                success = await create_chat_notification(
-                    chat_id=ObjectId(chat.id),
-                    customer_id=str(customer.id),
-                    content=notification_content,
-                    notification_config_id=notification_config_id,
-                    data=data
-                )
+        # Process customers batch by batch as they arrive from the cursor
+        async with aclosing(iter_audience_batches(query, settings.notification_batch_size)) as batches:
+            async for chunk in batches:
+                # Stop between batches once the task or its parent is cancelled
+                await progress.raise_if_cancelled()
                 
-                if success:
-                    task_obj.processed_items += 1
-                    print(f"[TASK] Sent chat notification to: {customer.email}")
+                if send_mode == "batch":
+                    counts = await send_chat_notifications_batch(
+                        chunk, template, notification_config_id, data
+                    )
                 else:
-                    task_obj.failed_items += 1
-                    print(f"[TASK] Failed to send chat notification to: {customer.email}")
-                
-            except Exception as e:
-                task_obj.failed_items += 1
-                print(f"[TASK] Error sending to {customer.email}: {str(e)}")
+                    counts = await send_chat_notifications_single(
+                        chunk, template, notification_config_id, data
+                    )
             
-            # Update progress every 5 customers
-            if (index + 1) % 5 == 0:
-                task_obj.progress = (index + 1) / len(customers)
-                await task_obj.commit()
-                print(f"[TASK] Progress: {task_obj.progress:.2%}")
+                # New system messages make cached chat contexts stale
+                await context_cache.invalidate([customer["_id"] for customer in chunk])
+                
+                seen_customers += len(chunk)
+                await progress.advance(counts["sent"], counts["failed"], seen=seen_customers)
+                print(f"[TASK] Progress: {progress.progress:.2%}")
         
-        # Final progress update
-        task_obj.progress = 1.0
-        task_obj.status = "completed"
-        task_obj.completed_at = datetime.now()
-        await task_obj.commit()
+        total_customers = seen_customers
         
+        success_rate = (progress.processed_items / total_customers) * 100 if total_customers else 0
         result = {
             "status": "completed",
-            "total_customers": len(customers),
-            "sent": task_obj.processed_items,
-            "failed": task_obj.failed_items,
-            "success_rate": f"{(task_obj.processed_items / len(customers)) * 100:.1f}%"
+            "total_customers": total_customers,
+            "sent": progress.processed_items,
+            "failed": progress.failed_items,
+            "success_rate": f"{success_rate:.1f}%"
         }
         
-        task_obj.result = result
-        await task_obj.commit()
+        # Final progress update
+        await progress.complete(result)
         
         print(f"[TASK] Chat notification sending completed: {result}")
         return result
+    
+    except TaskCancelled:
+        # Keep what was sent so far, the cursor is already closed
+        result = {
+            "status": "cancelled",
+            "total_customers": seen_customers,
+            "sent": progress.processed_items,
+            "failed": progress.failed_items
+        }
+        await progress.cancel(result)
+        
+        print(f"[TASK] Chat notification sending cancelled: {result}")
+        return result
         
     except Exception as e:
         # Update task status to failed
-        task_obj.status = "failed"
-        task_obj.error_message = str(e)
-        task_obj.completed_at = datetime.now()
-        await task_obj.commit()
+        await progress.fail(str(e))
         
         print(f"[TASK] Chat notification sending failed: {str(e)}")
         raise
 
 
+def customer_id_range_filter(id_range: Dict[str, Optional[str]]) -> Dict[str, ObjectId]:
+    """Build an _id filter from {"gte", "lt"} shard bounds, either of which may be None."""
+    id_filter = {}
+    if id_range.get("gte"):
+        id_filter["$gte"] = ObjectId(id_range["gte"])
+    if id_range.get("lt"):
+        id_filter["$lt"] = ObjectId(id_range["lt"])
+    return id_filter
+
+
+async def plan_customer_shards(
+    customer_ids: List[str],
+    shard_size: int
+) -> List[Dict[str, Any]]:
+    """
+    Split a notification audience into shards that workers can send in parallel.
+    
+    Explicit ID lists are cut into slices, each counted by the customers it
+    resolves to. For ["all"] the active customers are counted first; only
+    audiences larger than one shard walk the _id index with an _id-only
+    projection, making every shard_size-th id a range boundary. Runs in the
+    worker, never on the API request path.
+    
+    Args:
+        customer_ids: List of customer IDs or ["all"] for all customers
+        shard_size: Maximum number of customers per shard
+        
+    Returns:
+        List of shards with "customer_ids", "id_range" and "total" keys
+    """
+    Customer = get_customer()
+    if customer_ids != ["all"]:
+        shards = []
+        for start in range(0, len(customer_ids), shard_size):
+            shard_ids = customer_ids[start:start + shard_size]
+            # Only ids that still resolve to a customer count towards the total
+            total = await Customer.collection.count_documents(
+                {"_id": {"$in": [ObjectId(customer_id) for customer_id in shard_ids]}}
+            )
+            shards.append({"customer_ids": shard_ids, "id_range": None, "total": total})
+        return shards
+    
+    total = await Customer.collection.count_documents({"is_active": True})
+    if total <= shard_size:
+        return [{"customer_ids": ["all"], "id_range": None, "total": total}]
+    
+    shards = []
+    lower = None
+    count = 0
+    cursor = Customer.collection.find({"is_active": True}, {"_id": 1}).sort("_id", 1)
+    async for doc in cursor:
+        if count == shard_size:
+            upper = str(doc["_id"])
+            shards.append({"customer_ids": ["all"], "id_range": {"gte": lower, "lt": upper}, "total": count})
+            lower = upper
+            count = 0
+        count += 1
+    if count or not shards:
+        shards.append({"customer_ids": ["all"], "id_range": {"gte": lower, "lt": None}, "total": count})
+    return shards
+
+
+async def enqueue_notification_shards(
+    parent,
+    shards: List[Dict[str, Any]],
+    notification_config_id: str,
+    data: Dict[str, Any],
+    user_id: str,
+    send_mode: str
+) -> Dict[str, Any]:
+    """
+    Turn a running send task into the parent of one child task per shard.
+    
+    The parent stays running; its shards roll their progress up into it and
+    the last one to finish marks it completed or failed.
+    """
+    Task = get_task()
+    total = sum(shard["total"] for shard in shards)
+    # The shard count must be known before any shard can finish
+    await Task.collection.update_one(
+        {"job_id": parent.job_id},
+        {"$set": {"total_items": total, "shard_count": len(shards), "updated_at": datetime.now()}}
+    )
+    
+    for shard in shards:
+        # Child task records exist before the workers can pick the shards up
+        job_id = uuid.uuid4().hex
+        child = Task(
+            job_id=job_id,
+            task_name="send_notification_shard",
+            status="pending",
+            user_id=user_id,
+            parent_job_id=parent.job_id,
+            total_items=shard["total"],
+            parameters={
+                "customer_ids": shard["customer_ids"],
+                "id_range": shard["id_range"],
+                "notification_config_id": notification_config_id,
+                "data": data,
+                "send_mode": send_mode
+            }
+        )
+        await child.commit()
+        await send_notification_task.kicker().with_task_id(job_id).kiq(
+            customer_ids=shard["customer_ids"],
+            notification_config_id=notification_config_id,
+            data=data,
+            user_id=user_id,
+            send_mode=send_mode,
+            id_range=shard["id_range"],
+            parent_job_id=parent.job_id
+        )
+    
+    print(f"[TASK] Split {total} customers into {len(shards)} shards")
+    return {"status": "sharded", "total_customers": total, "shards": len(shards)}
+
+
+async def iter_audience_batches(query: Dict[str, Any], batch_size: int):
+    """
+    Stream the notification audience from a Motor cursor in batches.
+    
+    Only the fields needed for rendering are projected, so peak memory is
+    bounded by batch_size instead of the number of customers. The server
+    cursor is closed when the generator is closed early.
+    """
+    Customer = get_customer()
+    cursor = Customer.collection.find(query, AUDIENCE_PROJECTION).batch_size(batch_size)
+    try:
+        batch = []
+        async for customer in cursor:
+            batch.append(customer)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        await cursor.close()
+
+
+def render_notification(template: CompiledTemplate, customer: Dict[str, Any]) -> str:
+    """Render a data-bound notification template for a projected customer document."""
+    return template.render({
+        "customer_name": customer.get("full_name"),
+        "customer_email": customer.get("email"),
+        "company": customer.get("company") or "FTEL"
+    })
+
+
+async def send_chat_notifications_single(
+    customers: List[Dict[str, Any]],
+    template: CompiledTemplate,
+    notification_config_id: str,
+    data: Dict[str, Any]
+) -> Dict[str, int]:
+    """
+    Send chat notifications one customer at a time.
+    
+    Returns:
+        Dict with "sent" and "failed" counts for the chunk
+    """
+    counts = {"sent": 0, "failed": 0}
+    for customer in customers:
+        try:
+            # Get or create chat session
+            chat = await get_or_create_chat_session(str(customer["_id"]))
+            
+            # Render notification content
+            notification_content = render_notification(template, customer)
+            
+            # Create system message in chat
+            success = await create_chat_notification(
+                chat_id=ObjectId(chat.id),
+                customer_id=str(customer["_id"]),
+                content=notification_content,
+                notification_config_id=notification_config_id,
+                data=data
+            )
+            
+            if success:
+                counts["sent"] += 1
+                print(f"[TASK] Sent chat notification to: {customer.get('email')}")
+            else:
+                counts["failed"] += 1
+                print(f"[TASK] Failed to send chat notification to: {customer.get('email')}")
+        
+        except Exception as e:
+            counts["failed"] += 1
+            print(f"[TASK] Error sending to {customer.get('email')}: {str(e)}")
+    return counts
+
+
+async def send_chat_notifications_batch(
+    customers: List[Dict[str, Any]],
+    template: CompiledTemplate,
+    notification_config_id: str,
+    data: Dict[str, Any]
+) -> Dict[str, int]:
+    """
+    Send chat notifications to a chunk of customers with bulk writes.
+    
+    Chat sessions for the whole chunk are resolved with one $in query, missing
+    sessions are upserted with one bulk_write and the system messages are
+    inserted with one unordered insert_many.
+    
+    Returns:
+        Dict with "sent" and "failed" counts for the chunk
+    """
+    counts = {"sent": 0, "failed": 0}
+    
+    # Render content first so template errors only fail their own customer
+    rendered = []
+    for customer in customers:
+        try:
+            rendered.append((customer["_id"], render_notification(template, customer)))
+        except Exception as e:
+            counts["failed"] += 1
+            print(f"[TASK] Error rendering notification for {customer.get('email')}: {str(e)}")
+    if not rendered:
+        return counts
+    
+    chat_ids = await resolve_chat_sessions([customer_id for customer_id, _ in rendered])
+    
+    now = datetime.now(UTC)
+    documents = []
+    for customer_id, content in rendered:
+        chat_id = chat_ids.get(customer_id)
+        if chat_id is None:
+            counts["failed"] += 1
+            print(f"[TASK] No chat session for customer: {customer_id}")
+            continue
+        documents.append({
+            "chat": chat_id,
+            "customer": customer_id,
+            "content": content,
+            "role": "assistant",  # Show as bot message
+            "message_type": "system",  # System notification
+            "metadata": {
+                "notification_config_id": notification_config_id,
+                "notification_data": data,
+                "is_system_notification": True,
+                "created_at": now.isoformat()
+            },
+            "created_at": now
+        })
+    if not documents:
+        return counts
+    
+    Message = get_message()
+    inserted = documents
+    try:
+        result = await Message.collection.insert_many(documents, ordered=False)
+        counts["sent"] += len(result.inserted_ids)
+    except BulkWriteError as e:
+        write_errors = e.details.get("writeErrors", [])
+        counts["sent"] += e.details.get("nInserted", 0)
+        counts["failed"] += len(documents) - e.details.get("nInserted", 0)
+        failed_indexes = {error["index"] for error in write_errors}
+        inserted = [doc for index, doc in enumerate(documents) if index not in failed_indexes]
+        print(f"[TASK] {len(write_errors)} notification messages failed in batch: {write_errors[:1]}")
+    
+    await report_counters.record_messages(
+        "system", [doc["customer"] for doc in inserted], notification_config_id
+    )
+    
+    print(f"[TASK] Batch sent {counts['sent']} chat notifications, {counts['failed']} failed")
+    return counts
+
+
+async def resolve_chat_sessions(customer_ids: List[ObjectId]) -> Dict[ObjectId, ObjectId]:
+    """
+    Resolve active chat sessions for many customers at once.
+    
+    Existing sessions are found with a single $in query, missing ones are
+    upserted in one unordered bulk_write.
+    
+    Args:
+        customer_ids: Customer ObjectIds
+    
+    Returns:
+        Dict mapping customer ObjectId to active chat ObjectId
+    """
+    Chat = get_chat()
+    chat_ids = {}
+    cursor = Chat.collection.find(
+        {"customer": {"$in": customer_ids}, "is_active": True},
+        {"_id": 1, "customer": 1}
+    )
+    async for chat in cursor:
+        chat_ids.setdefault(chat["customer"], chat["_id"])
+    
+    missing = [customer_id for customer_id in customer_ids if customer_id not in chat_ids]
+    if not missing:
+        return chat_ids
+    
+    now = datetime.now(UTC)
+    operations = [
+        UpdateOne(
+            {"customer": customer_id, "is_active": True},
+            {"$setOnInsert": {
+                "session_id": str(uuid.uuid4()),
+                "started_at": now,
+                "metadata": {}
+            }},
+            upsert=True
+        )
+        for customer_id in missing
+    ]
+    try:
+        result = await Chat.collection.bulk_write(operations, ordered=False)
+        upserted = result.upserted_ids
+    except BulkWriteError as e:
+        upserted = {item["index"]: item["_id"] for item in e.details.get("upserted", [])}
+        print(f"[TASK] {len(e.details.get('writeErrors', []))} chat sessions failed to upsert")
+    
+    for index, chat_id in upserted.items():
+        chat_ids[missing[index]] = chat_id
+    
+    # Sessions created concurrently by another writer matched instead of
+    # upserting, or made the upsert fail on the unique active session index
+    unresolved = [customer_id for customer_id in missing if customer_id not in chat_ids]
+    if unresolved:
+        cursor = Chat.collection.find(
+            {"customer": {"$in": unresolved}, "is_active": True},
+            {"_id": 1, "customer": 1}
+        )
+        async for chat in cursor:
+            chat_ids.setdefault(chat["customer"], chat["_id"])
+    
+    print(f"[TASK] Created {len(upserted)} chat sessions")
+    return chat_ids
+
+
 async def get_or_create_chat_session(customer_id: str):
     """
     Get existing active chat session or create new one for customer.
@@ -146,14 +511,17 @@ async def get_or_create_chat_session(customer_id: str):
         return chat
     
     # Create new chat session
-    import uuid
     Chat = get_chat()
     chat = Chat(
         customer=customer_id,
         session_id=str(uuid.uuid4()),
         is_active=True
     )
-    await chat.commit()
+    try:
+        await chat.commit()
+    except ValidationError:
+        # Another writer created the active session first
+        return await Chat.find_one({"customer": customer_id, "is_active": True})
     
     print(f"[TASK] Created new chat session for customer: {customer_id}")
     return chat
@@ -196,10 +564,11 @@ async def create_chat_notification(
             }
         )
         await message.commit()
+        await report_counters.record_messages("system", [customer_id], notification_config_id)
         
         print(f"[TASK] Created system notification message: {message.id}")
         return True
         
     except Exception as e:
         print(f"[TASK] Error creating chat notification: {str(e)}")
-        return False 
\ No newline at end of file
+        return False 
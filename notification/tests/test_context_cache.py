@@ -0,0 +1,94 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+
+import services.context_cache as context_cache_module
+from services.context_cache import ContextCache
+from services.memory_manager import memory_manager
+
+CUSTOMER_ID = str(ObjectId())
+CHAT_ID = ObjectId()
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def get(self, key):
+        self.commands.append(lambda: self.redis.values.get(key))
+
+    def lrange(self, key, start, end):
+        self.commands.append(lambda: self.redis.lists.get(key, [])[start:])
+
+    async def execute(self, raise_on_error=True):
+        return [command() for command in self.commands]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.lists = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value
+
+
+def collection(document):
+    async def find_one(query, projection=None):
+        return document
+    return SimpleNamespace(collection=SimpleNamespace(find_one=find_one))
+
+
+def message(role, content, timestamp):
+    return {"role": role, "content": content, "timestamp": timestamp,
+            "message_type": "user" if role == "user" else "ai"}
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    customer = {"_id": ObjectId(CUSTOMER_ID), "full_name": "A", "email": "a@example.com", "company": None}
+    monkeypatch.setattr(context_cache_module, "get_customer", lambda: collection(customer))
+    monkeypatch.setattr(context_cache_module, "get_chat", lambda: collection({"_id": CHAT_ID}))
+
+    async def get_recent_notifications(customer_id, limit=10):
+        return [{"role": "assistant", "content": "Sale today", "timestamp": "2026-01-01T08:00:00",
+                 "message_type": "system"}]
+
+    async def get_long_term_memory(customer_id, limit=50, exclude_system=False):
+        return [
+            message("user", "old question", "2026-01-01T09:00:00"),
+            message("assistant", "old answer", "2026-01-01T09:00:01"),
+            message("user", "recent question", "2026-01-01T10:00:00"),
+        ]
+
+    monkeypatch.setattr(memory_manager, "get_recent_notifications", get_recent_notifications)
+    monkeypatch.setattr(memory_manager, "get_long_term_memory", get_long_term_memory)
+
+    cache = ContextCache()
+    cache._redis = FakeRedis()
+    # The latest turn is also in short-term memory, stamped by update_memory
+    recent = message("user", "recent question", 1767261602.0)  # 2026-01-01T10:00:02Z
+    cache._redis.lists[memory_manager.short_term_key(CUSTOMER_ID)] = [json.dumps(recent)]
+    return cache
+
+
+@pytest.mark.asyncio
+async def test_context_memory_includes_long_term_history(cache):
+    for _ in range(2):  # Cold build, then served from the cached entry
+        context = await cache.get_context(CUSTOMER_ID)
+
+        assert [msg["content"] for msg in context["memory"]] == [
+            "Sale today", "old question", "old answer", "recent question"
+        ]
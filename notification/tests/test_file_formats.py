@@ -0,0 +1,49 @@
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+from utils.file_formats import detect_file_format, count_rows, open_customer_frames, read_customer_file
+from utils.validators import validate_customer_frame, REJECTION_REASON_COLUMN
+
+
+@pytest.fixture
+def parquet_file(tmp_path):
+    """Parquet export with list<string> tags and a nullable numeric phone column."""
+    table = pa.table({
+        "email": ["a@example.com", "b@example.com", "c@example.com"],
+        "full_name": ["A", "B", "C"],
+        "tags": pa.array([["vip", "new"], [], None], pa.list_(pa.string())),
+        "phone": pa.array([841234567890.0, None, 84987654321.0]),
+        "extra": [1, 2, 3],
+    })
+    path = tmp_path / "customers.parquet"
+    pq.write_table(table, path)
+    return str(path)
+
+
+def test_detects_parquet_and_counts_rows_from_metadata(parquet_file):
+    assert detect_file_format(parquet_file) == "parquet"
+    assert count_rows(parquet_file, "parquet") == 3
+
+
+def test_list_tags_and_numeric_phones_are_converted(parquet_file):
+    with open_customer_frames(parquet_file, "parquet", chunk_size=2) as frames:
+        chunks = list(frames)
+
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    assert "extra" not in chunks[0].columns
+    assert chunks[0]["tags"].tolist() == ["vip,new", ""]
+    assert chunks[0]["phone"].iloc[0] == "841234567890"
+    assert chunks[1]["phone"].iloc[0] == "84987654321"
+
+    validated = validate_customer_frame(chunks[0])
+    assert validated[REJECTION_REASON_COLUMN].isna().all()
+    assert validated["tags"].tolist() == [["vip", "new"], []]
+    assert validated["phone"].iloc[0] == "841234567890"
+
+
+def test_whole_file_read_matches_batches(parquet_file):
+    frame = read_customer_file(parquet_file, "parquet")
+    assert frame["tags"].tolist()[:2] == ["vip,new", ""]
+    assert frame["phone"].iloc[2] == "84987654321"
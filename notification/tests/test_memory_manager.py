@@ -0,0 +1,47 @@
+from datetime import datetime, UTC
+
+from services.memory_manager import merge_conversation
+
+
+def long_term_message(role, content, epoch):
+    """A message as read from MongoDB, stamped with a naive UTC created_at."""
+    created_at = datetime.fromtimestamp(epoch, UTC).replace(tzinfo=None)
+    message_type = "user" if role == "user" else "ai"
+    return {"role": role, "content": content, "timestamp": created_at.isoformat(), "message_type": message_type}
+
+
+def short_term_message(role, content, epoch):
+    """A message as appended to Redis by update_memory, stamped with time.time()."""
+    message_type = "user" if role == "user" else "ai"
+    return {"role": role, "content": content, "timestamp": epoch, "message_type": message_type}
+
+
+def test_turns_stored_in_both_sources_appear_once():
+    long_term = [
+        long_term_message("user", "hello", 1000.0),
+        long_term_message("assistant", "hi there", 1002.5),
+        long_term_message("user", "price?", 1100.0),
+        long_term_message("assistant", "10$", 1103.0),
+    ]
+    # The last two turns also sit in Redis, stamped a little after the commit
+    short_term = [
+        short_term_message("user", "price?", 1104.2),
+        short_term_message("assistant", "10$", 1104.2),
+        short_term_message("user", "thanks", 1200.0),
+    ]
+
+    conversation = merge_conversation(short_term, long_term)
+
+    assert [msg["content"] for msg in conversation] == ["hello", "hi there", "price?", "10$", "thanks"]
+
+
+def test_repeats_within_one_source_or_outside_the_window_are_kept():
+    long_term = [long_term_message("user", "ok", 1000.0)]
+    short_term = [
+        short_term_message("user", "ok", 2000.0),
+        short_term_message("user", "ok", 2001.0),
+    ]
+
+    conversation = merge_conversation(short_term, long_term)
+
+    assert [msg["timestamp"] for msg in conversation] == [long_term[0]["timestamp"], 2000.0, 2001.0]
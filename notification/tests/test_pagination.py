@@ -0,0 +1,75 @@
+import base64
+import json
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import api.customer as customer_api
+from services.auth import get_current_active_user
+from utils.pagination import encode_cursor, decode_cursor, keyset_query, next_cursor
+
+
+def b64(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+MALFORMED_CURSORS = [
+    "not a cursor!",
+    b64({"t": "2026-10-18T10:00:00"}),
+    b64({"t": "yesterday", "id": str(ObjectId())}),
+    b64({"t": "2026-10-18T10:00:00", "id": "not-an-object-id"}),
+    b64({"t": 12, "id": str(ObjectId())}),
+    b64(["2026-10-18T10:00:00", str(ObjectId())]),
+]
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 10, 18, 10, 30, 15, 123000)
+    object_id = ObjectId()
+
+    assert decode_cursor(encode_cursor(created_at, object_id)) == (created_at, object_id)
+
+
+def test_keyset_query_seeks_after_the_cursor():
+    created_at = datetime(2026, 10, 18, 10, 30)
+    object_id = ObjectId()
+
+    query = keyset_query({"message_type": "system"}, encode_cursor(created_at, object_id))
+
+    assert query == {"$and": [
+        {"message_type": "system"},
+        {"$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": object_id}}
+        ]}
+    ]}
+    assert keyset_query({"status": "running"}, None) == {"status": "running"}
+
+
+def test_next_cursor_only_for_full_pages():
+    documents = [{"_id": ObjectId(), "created_at": datetime(2026, 10, 18)} for _ in range(2)]
+
+    assert next_cursor(documents, 3) is None
+    assert decode_cursor(next_cursor(documents, 2)) == (documents[1]["created_at"], documents[1]["_id"])
+
+
+@pytest.mark.parametrize("cursor", MALFORMED_CURSORS)
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        keyset_query({}, cursor)
+
+
+@pytest.mark.parametrize("cursor", MALFORMED_CURSORS)
+def test_malformed_cursor_is_a_bad_request(cursor, monkeypatch):
+    monkeypatch.setattr(customer_api, "get_customer", lambda: None)
+    app = FastAPI()
+    app.include_router(customer_api.router)
+    app.dependency_overrides[get_current_active_user] = lambda: object()
+
+    response = TestClient(app).get("/customers/", params={"after": cursor})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid pagination cursor"
@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+
+import pytest
+
+import services.progress as progress_module
+import tasks.send_notification as send_module
+from services.progress import ProgressReporter, TaskCancelled, request_cancel
+
+
+class FakeRedis:
+    def __init__(self):
+        self.keys = {}
+        self.published = []
+
+    async def set(self, key, value, ex=None):
+        self.keys[key] = value
+
+    async def exists(self, *keys):
+        return sum(key in self.keys for key in keys)
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+
+
+class FakeTaskCollection:
+    """Just enough of a Motor collection for ProgressReporter updates."""
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def _matches(self, document, query):
+        for key, condition in query.items():
+            if isinstance(condition, dict) and "$ne" in condition:
+                if document.get(key) == condition["$ne"]:
+                    return False
+            elif document.get(key) != condition:
+                return False
+        return True
+
+    async def find_one_and_update(self, query, update, projection=None, return_document=None):
+        for document in self.documents:
+            if self._matches(document, query):
+                document.update(update.get("$set", {}))
+                for key, value in update.get("$inc", {}).items():
+                    document[key] = document.get(key, 0) + value
+                return {key: document.get(key) for key in ("job_id", "status")}
+        return None
+
+
+@pytest.fixture
+def pending_task(monkeypatch):
+    document = {"job_id": "job-1", "status": "pending", "total_items": 0, "processed_items": 0,
+                "failed_items": 0, "progress": 0.0}
+    collection = FakeTaskCollection([document])
+
+    async def find_one(query):
+        return SimpleNamespace(**document) if query["job_id"] == document["job_id"] else None
+
+    fake_model = SimpleNamespace(collection=collection, find_one=find_one)
+    redis = FakeRedis()
+    monkeypatch.setattr(progress_module, "get_task", lambda: fake_model)
+    monkeypatch.setattr(progress_module, "get_redis", lambda: redis)
+    monkeypatch.setattr(send_module, "get_task", lambda: fake_model)
+    return document
+
+
+@pytest.mark.asyncio
+async def test_cancelled_pending_send_never_runs(pending_task, monkeypatch):
+    async def plan_customer_shards(*args):
+        raise AssertionError("shards planned for a cancelled task")
+
+    monkeypatch.setattr(send_module, "plan_customer_shards", plan_customer_shards)
+
+    # What /tasks/{job_id}/cancel does to a pending task
+    await request_cancel("job-1")
+    pending_task["status"] = "cancelled"
+
+    result = await send_module.send_notification_task(
+        ["all"], "config", {}, "user",
+        context=SimpleNamespace(message=SimpleNamespace(task_id="job-1"))
+    )
+
+    assert result["status"] == "cancelled"
+    assert pending_task["status"] == "cancelled"
+    assert "started_at" not in pending_task
+
+
+@pytest.mark.asyncio
+async def test_late_start_keeps_cancelled_status(pending_task):
+    # Cancelled in the database without the Redis flag, e.g. after it expired
+    pending_task["status"] = "cancelled"
+
+    with pytest.raises(TaskCancelled):
+        await ProgressReporter(SimpleNamespace(**pending_task)).start()
+    assert pending_task["status"] == "cancelled"
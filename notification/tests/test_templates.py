@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+
+import pytest
+
+from utils.templates import compile_template
+
+TEMPLATE = "Hi {customer_name}, order {order.id} ships on {order.date!s:>10} from {stores[0]}"
+
+
+def test_render_matches_str_format_for_dotted_and_indexed_fields():
+    values = {
+        "customer_name": "Lan",
+        "order": SimpleNamespace(id=42, date="2026-10-20"),
+        "stores": ["Hanoi"],
+    }
+
+    assert compile_template(TEMPLATE).render(values) == TEMPLATE.format(**values)
+
+
+def test_variables_are_root_names():
+    assert compile_template(TEMPLATE).variables == ["customer_name", "order", "stores"]
+
+
+def test_missing_variable_raises_key_error():
+    with pytest.raises(KeyError):
+        compile_template(TEMPLATE).render({"customer_name": "Lan", "stores": ["Hanoi"]})
+
+
+def test_partial_binds_shared_data_and_leaves_customer_fields():
+    shared = {"order": SimpleNamespace(id=42, date="2026-10-20"), "stores": ["Hanoi"]}
+
+    bound = compile_template(TEMPLATE).partial(shared)
+
+    assert bound.variables == ["customer_name"]
+    assert bound.render({"customer_name": "Lan"}) == TEMPLATE.format(customer_name="Lan", **shared)
+    with pytest.raises(KeyError):
+        bound.render({})
+
+
+def test_malformed_or_positional_templates_are_rejected():
+    for template in ("Hi {name", "Hi {}", "Hi {0}", "Hi {name:{width}}"):
+        with pytest.raises(ValueError):
+            compile_template(template)
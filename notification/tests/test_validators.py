@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+from utils.validators import validate_customer_frame, normalize_email, REJECTION_REASON_COLUMN
+
+
+def frame(rows):
+    return pd.DataFrame(rows, columns=["email", "full_name", "phone", "tags", "language"])
+
+
+def test_normalize_email():
+    assert normalize_email("  Jane.Doe@Example.COM ") == "jane.doe@example.com"
+
+
+def test_bad_phones_are_dropped_without_rejecting_the_row():
+    result = validate_customer_frame(frame([
+        ["a@example.com", "A", "(084) 123-456-789", None, None],
+        ["b@example.com", "B", "12ab", None, None],
+        ["c@example.com", "C", "123", None, None],
+    ]))
+
+    assert result["phone"].tolist()[0] == "084123456789"
+    assert result["phone"].isna().tolist() == [False, True, True]
+    assert result[REJECTION_REASON_COLUMN].isna().all()
+
+
+def test_duplicate_emails_in_a_chunk_reject_later_rows():
+    result = validate_customer_frame(frame([
+        ["A@Example.com", "A", None, None, None],
+        [" a@example.com", "A again", None, None, None],
+        ["b@example.com", "B", None, None, None],
+    ]))
+
+    assert result["email"].tolist() == ["a@example.com", "a@example.com", "b@example.com"]
+    assert result[REJECTION_REASON_COLUMN].tolist()[1] == "duplicate_email"
+    assert result[REJECTION_REASON_COLUMN].isna().tolist() == [True, False, True]
+
+
+def test_nan_and_blank_cells_are_missing_values():
+    result = validate_customer_frame(frame([
+        [np.nan, "A", np.nan, np.nan, np.nan],
+        ["b@example.com", "   ", np.nan, " vip, ,new ", np.nan],
+        ["not-an-email", "C", np.nan, "", "en"],
+        ["d@example.com", "D", np.nan, np.nan, np.nan],
+    ]))
+
+    assert result[REJECTION_REASON_COLUMN].tolist()[:3] == ["missing_email", "missing_full_name", "invalid_email"]
+    assert pd.isna(result[REJECTION_REASON_COLUMN].iloc[3])
+    assert result["tags"].tolist() == [[], ["vip", "new"], [], []]
+    assert result["language"].tolist() == ["vi", "vi", "en", "vi"]
+    assert result["phone"].isna().all()
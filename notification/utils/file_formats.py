@@ -0,0 +1,223 @@
+import gzip
+import io
+import os
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+import pandas as pd
+
+from utils.validators import CUSTOMER_COLUMNS, validate_customer_frame
+
+
+# Leading magic bytes of the supported binary formats; anything else is
+# accepted as plain CSV if it looks like text
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+PARQUET_MAGIC = b"PAR1"
+SNIFF_SIZE = 4096
+
+# Detected format -> file extension used for the stored upload
+FILE_EXTENSIONS = {
+    "csv": ".csv",
+    "csv.gz": ".csv.gz",
+    "csv.zst": ".csv.zst",
+    "parquet": ".parquet",
+}
+CSV_COMPRESSION = {"csv": None, "csv.gz": "gzip", "csv.zst": "zstd"}
+
+# Parallel parsing: ranges per process and smallest range worth a process hop
+RANGES_PER_WORKER = 4
+MIN_RANGE_SIZE = 256 * 1024
+
+
+def detect_file_format(file_path: str) -> Optional[str]:
+    """
+    Detect the format of an import file from its first bytes.
+
+    Returns:
+        "csv", "csv.gz", "csv.zst" or "parquet", None if the file is
+        neither a supported binary format nor text
+    """
+    with open(file_path, "rb") as f:
+        head = f.read(SNIFF_SIZE)
+    if head.startswith(GZIP_MAGIC):
+        return "csv.gz"
+    if head.startswith(ZSTD_MAGIC):
+        return "csv.zst"
+    if head.startswith(PARQUET_MAGIC):
+        return "parquet"
+    if not head or b"\x00" in head:
+        return None
+    return "csv"
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet imports require the pyarrow package")
+    return pyarrow
+
+
+def _open_csv(file_path: str, file_format: str):
+    """Open a possibly compressed CSV file as a binary stream of its plain content."""
+    compression = CSV_COMPRESSION[file_format]
+    if compression == "gzip":
+        return gzip.open(file_path, "rb")
+    if compression == "zstd":
+        import zstandard
+        return zstandard.open(file_path, "rb")
+    return open(file_path, "rb")
+
+
+def count_rows(file_path: str, file_format: str) -> int:
+    """
+    Count data rows without parsing the file.
+
+    Parquet row counts come from the footer metadata and are exact. CSV is
+    scanned for newlines in blocks, decompressing on the fly, which is an
+    estimate: quoted fields spanning several lines are counted once per
+    line. Importers correct the total from the rows actually read.
+    """
+    if file_format == "parquet":
+        pa = _import_pyarrow()
+        return pa.parquet.ParquetFile(file_path).metadata.num_rows
+
+    lines = 0
+    last_block = b""
+    with _open_csv(file_path, file_format) as f:
+        while block := f.read(1024 * 1024):
+            lines += block.count(b"\n")
+            last_block = block
+    if last_block and not last_block.endswith(b"\n"):
+        lines += 1
+    return max(lines - 1, 0)  # Header row
+
+
+@contextmanager
+def open_customer_frames(file_path: str, file_format: str, chunk_size: int) -> Iterator[Iterator[pd.DataFrame]]:
+    """
+    Yield an iterator over the file's rows as DataFrames of string columns.
+
+    CSV is parsed in chunks by pandas, decompressing gzip/zstd on the fly.
+    Parquet is memory mapped and read in record batches of only the
+    customer columns, converted column by column to the strings a CSV
+    export would contain.
+    """
+    if file_format != "parquet":
+        with pd.read_csv(
+            file_path, dtype=str, chunksize=chunk_size, compression=CSV_COMPRESSION[file_format]
+        ) as reader:
+            yield reader
+        return
+
+    pa = _import_pyarrow()
+    with pa.memory_map(file_path, "r") as source:
+        parquet_file = pa.parquet.ParquetFile(source)
+        columns = [name for name in parquet_file.schema_arrow.names if name in CUSTOMER_COLUMNS]
+
+        def frames():
+            for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+                yield _string_frame(batch)
+
+        yield frames()
+
+
+def _string_column(pa, array):
+    """
+    Convert one Arrow column to strings the way a CSV export would spell them.
+
+    Lists are joined with commas, like the tags column of a CSV. Integers,
+    and floats holding only whole numbers (integer columns with nulls
+    written by pandas), are formatted without a decimal part so numeric
+    phone numbers stay valid.
+    """
+    import pyarrow.compute as pc
+    if pa.types.is_list(array.type) or pa.types.is_large_list(array.type):
+        return pc.binary_join(array.cast(pa.list_(pa.string())), ",")
+    if pa.types.is_floating(array.type):
+        whole = pc.fill_null(pc.equal(array, pc.floor(array)), True)
+        if pc.all(whole).as_py():
+            array = array.cast(pa.int64())
+    try:
+        return array.cast(pa.string())
+    except pa.ArrowNotImplementedError:
+        return pa.array([None if value is None else str(value) for value in array.to_pylist()], pa.string())
+
+
+def _string_frame(batch) -> pd.DataFrame:
+    """Convert an Arrow record batch or table to a DataFrame of string columns."""
+    pa = _import_pyarrow()
+    return pd.DataFrame(
+        {name: _string_column(pa, column).to_pandas() for name, column in zip(batch.schema.names, batch.columns)},
+        dtype=object
+    )
+
+
+def read_customer_file(file_path: str, file_format: str) -> pd.DataFrame:
+    """Read a whole import file into one DataFrame."""
+    if file_format == "parquet":
+        pa = _import_pyarrow()
+        return _string_frame(pa.parquet.read_table(file_path))
+    return pd.read_csv(file_path, compression=CSV_COMPRESSION[file_format])
+
+
+def available_cpus() -> int:
+    """
+    CPUs this process may run on, e.g. the cores assigned to its container.
+
+    Falls back to the host CPU count where CPU affinity is not available.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def plan_range_size(data_size: int, workers: int, max_range_size: int) -> int:
+    """
+    Size byte ranges so every parser process gets several of them.
+
+    RANGES_PER_WORKER ranges per process keep all of them busy, bounded by
+    MIN_RANGE_SIZE so per-range overhead stays small and by max_range_size
+    so memory stays bounded.
+    """
+    range_size = data_size // (workers * RANGES_PER_WORKER) + 1
+    return min(max_range_size, max(MIN_RANGE_SIZE, range_size))
+
+
+def split_csv_ranges(file_path: str, range_size: int) -> Tuple[bytes, List[Tuple[int, int]]]:
+    """
+    Split a plain CSV file into byte ranges of about range_size bytes.
+
+    Every range ends on a line boundary so it can be parsed on its own with
+    the header row. Quoted fields spanning several lines are not supported;
+    such files should be imported as a stream.
+
+    Returns:
+        Tuple of (header line, list of (start, end) byte offsets)
+    """
+    ranges = []
+    with open(file_path, "rb") as f:
+        header = f.readline()
+        start = f.tell()
+        size = os.fstat(f.fileno()).st_size
+        while start < size:
+            f.seek(min(start + range_size, size))
+            f.readline()
+            end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return header, ranges
+
+
+def parse_customer_range(file_path: str, header: bytes, start: int, end: int) -> pd.DataFrame:
+    """
+    Parse and validate one byte range of a CSV file.
+
+    Runs in a worker process, so it only takes and returns picklable values.
+    """
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    chunk = pd.read_csv(io.BytesIO(header + data), dtype=str)
+    return validate_customer_frame(chunk)
@@ -0,0 +1,60 @@
+import base64
+import json
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from bson import ObjectId
+
+
+# Newest first, _id breaks ties between equal timestamps
+KEYSET_SORT = [("created_at", -1), ("_id", -1)]
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(created_at: datetime, object_id: ObjectId) -> str:
+    """Encode the (created_at, _id) position of a document as an opaque token."""
+    payload = json.dumps({"t": created_at.isoformat(), "id": str(object_id)})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> tuple:
+    """Decode an `after` token, raising ValueError if it is malformed."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload["t"]), ObjectId(payload["id"])
+    except Exception:
+        raise ValueError("Invalid pagination cursor")
+
+
+def keyset_query(query: Dict[str, Any], after: Optional[str]) -> Dict[str, Any]:
+    """
+    Restrict a query to documents after the cursor in KEYSET_SORT order.
+
+    With a (created_at, _id) index this is an index seek instead of skipping
+    over every earlier document.
+    """
+    if not after:
+        return query
+    created_at, object_id = decode_cursor(after)
+    position = {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": object_id}}
+    ]}
+    return {"$and": [query, position]} if query else position
+
+
+def next_cursor(documents: List[Any], limit: int) -> Optional[str]:
+    """Cursor after the last document of a full page, None on the last page."""
+    if not documents or len(documents) < limit:
+        return None
+    last = documents[-1]
+    if isinstance(last, dict):
+        return encode_cursor(last["created_at"], last["_id"])
+    return encode_cursor(last.created_at, last.id)
+
+
+def set_next_cursor(response, documents: List[Any], limit: int):
+    """Expose the next page cursor in the X-Next-Cursor header, if there is one."""
+    cursor = next_cursor(documents, limit)
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
@@ -0,0 +1,24 @@
+from typing import List, Dict, Any, Optional, Tuple
+
+
+async def find_raw(
+    model,
+    query: Dict[str, Any],
+    projection: Dict[str, int],
+    sort: Optional[List[Tuple[str, int]]] = None,
+    skip: int = 0,
+    limit: int = 100
+) -> List[Dict[str, Any]]:
+    """
+    Run a projected Motor query on a model's collection and return the raw documents.
+
+    Skips umongo Document hydration and validation for read-only endpoints
+    that only copy a few fields into a response model. Fields missing from a
+    document are absent instead of filled with the model defaults.
+    """
+    cursor = model.collection.find(query, projection)
+    if sort:
+        cursor = cursor.sort(sort)
+    if skip:
+        cursor = cursor.skip(skip)
+    return await cursor.limit(limit).to_list(length=limit)
@@ -0,0 +1,12 @@
+import json
+from typing import Dict, Any, Optional
+
+
+# Headers that keep proxies from buffering or caching an event stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def format_sse(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    """Format a payload as a server-sent event."""
+    payload = f"data: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+    return f"event: {event}\n{payload}" if event else payload
@@ -0,0 +1,100 @@
+import re
+import string
+from functools import lru_cache
+from typing import List, Dict, Any, Optional
+
+
+_formatter = string.Formatter()
+_IDENTIFIER_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+_FIELD_ROOT_PATTERN = re.compile(r'^[^.\[]+')
+
+
+class CompiledTemplate:
+    """
+    Notification template pre-parsed into literal and field segments.
+
+    Parsing and variable validation happen once; render() only fills the
+    field slots and joins the segments. Supports the same named-field
+    syntax as str.format, including attribute/index lookups, conversions
+    and format specs.
+    """
+
+    def __init__(self, template: str):
+        self.template = template
+        self._parts: List[str] = []
+        # (slot index, field name, conversion, format spec, is plain name)
+        self._fields: List[tuple] = []
+
+        try:
+            parsed = list(_formatter.parse(template))
+        except ValueError as e:
+            raise ValueError(f"Invalid template: {str(e)}")
+
+        for literal_text, field_name, format_spec, conversion in parsed:
+            if literal_text:
+                self._parts.append(literal_text)
+            if field_name is None:
+                continue
+            root = _FIELD_ROOT_PATTERN.match(field_name)
+            if not root or not _IDENTIFIER_PATTERN.match(root.group(0)):
+                raise ValueError(f"Invalid template variable '{{{field_name}}}', only named variables are supported")
+            if format_spec and "{" in format_spec:
+                raise ValueError(f"Nested fields in format spec of '{{{field_name}}}' are not supported")
+            is_plain = conversion is None and not format_spec and field_name == root.group(0)
+            self._fields.append((len(self._parts), field_name, conversion, format_spec, is_plain))
+            self._parts.append("")
+
+        self.variables = sorted({_FIELD_ROOT_PATTERN.match(field[1]).group(0) for field in self._fields})
+
+    def render(self, values: Dict[str, Any]) -> str:
+        """Render the template, raising KeyError for missing variables like str.format."""
+        parts = self._parts.copy()
+        for index, field_name, conversion, format_spec, is_plain in self._fields:
+            if is_plain:
+                value = values[field_name]
+                parts[index] = value if type(value) is str else format(value)
+            else:
+                parts[index] = _render_field(values, field_name, conversion, format_spec)
+        return "".join(parts)
+
+    def partial(self, values: Dict[str, Any]) -> "CompiledTemplate":
+        """
+        Return a copy with every field whose variable is in values rendered into a literal.
+
+        Used to bind the data shared by all recipients once per send, so only
+        the per-customer fields are left for render().
+        """
+        bound = CompiledTemplate.__new__(CompiledTemplate)
+        bound.template = self.template
+        bound._parts = self._parts.copy()
+        bound._fields = []
+        for field in self._fields:
+            index, field_name, conversion, format_spec, is_plain = field
+            if _FIELD_ROOT_PATTERN.match(field_name).group(0) in values:
+                bound._parts[index] = _render_field(values, field_name, conversion, format_spec)
+            else:
+                bound._fields.append(field)
+        bound.variables = sorted({_FIELD_ROOT_PATTERN.match(field[1]).group(0) for field in bound._fields})
+        return bound
+
+
+def _render_field(values: Dict[str, Any], field_name: str, conversion: Optional[str], format_spec: str) -> str:
+    """Render a single field the way str.format would."""
+    obj, _ = _formatter.get_field(field_name, (), values)
+    obj = _formatter.convert_field(obj, conversion)
+    return _formatter.format_field(obj, format_spec)
+
+
+def compile_template(template: str) -> CompiledTemplate:
+    """Parse and validate a template, raising ValueError if it is malformed."""
+    return CompiledTemplate(template)
+
+
+@lru_cache(maxsize=256)
+def _get_cached_template(config_id: str, updated_at, template: str) -> CompiledTemplate:
+    return compile_template(template)
+
+
+def get_compiled_template(config) -> CompiledTemplate:
+    """Get the compiled body template of a NotificationConfig, cached by id and updated_at."""
+    return _get_cached_template(str(config.id), config.updated_at, config.body_template)
@@ -0,0 +1,40 @@
+import hashlib
+import os
+from typing import BinaryIO, Tuple
+
+
+# Copy uploads in 1MB chunks so memory stays flat regardless of file size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds the configured maximum size."""
+
+
+def copy_upload(source: BinaryIO, file_path: str, max_size: int) -> Tuple[int, str]:
+    """
+    Copy an uploaded file to disk chunk by chunk, hashing it along the way.
+
+    Blocking; run it in a thread pool. The partial file is removed if the
+    size limit is exceeded or the copy fails.
+
+    Returns:
+        Tuple of (size in bytes, sha256 hex digest)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(file_path, "wb") as buffer:
+            while chunk := source.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(f"File exceeds the maximum size of {max_size} bytes")
+                digest.update(chunk)
+                buffer.write(chunk)
+    except BaseException:
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+        raise
+    return size, digest.hexdigest()
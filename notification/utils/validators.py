@@ -2,19 +2,34 @@ import re
 from typing import List, Dict, Any
 import pandas as pd
 
+from utils.templates import compile_template
+
+
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+PHONE_SEPARATORS_PATTERN = re.compile(r'[\s\-\(\)]')
+PHONE_PATTERN = re.compile(r'^\+?[0-9]{10,15}$')
+TAG_SEPARATOR_PATTERN = re.compile(r'\s*,[\s,]*')
+
+CUSTOMER_COLUMNS = ['email', 'full_name', 'phone', 'company', 'position', 'address', 'city', 'country', 'language', 'tags']
+REJECTION_REASON_COLUMN = 'rejection_reason'
+
+
+def normalize_email(email: str) -> str:
+    """Normalize an email the way customer imports store it."""
+    return email.strip().lower()
+
 
 def validate_email(email: str) -> bool:
     """Validate email format."""
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(pattern, email))
+    return bool(EMAIL_PATTERN.match(email))
 
 
 def validate_phone(phone: str) -> bool:
     """Validate phone number format."""
     # Remove spaces, dashes, parentheses
-    phone = re.sub(r'[\s\-\(\)]', '', phone)
+    phone = PHONE_SEPARATORS_PATTERN.sub('', phone)
     # Check if it's a valid phone number (10-15 digits)
-    return bool(re.match(r'^\+?[0-9]{10,15}$', phone))
+    return bool(PHONE_PATTERN.match(phone))
 
 
 def validate_csv_structure(df: pd.DataFrame) -> Dict[str, Any]:
@@ -46,7 +61,7 @@ def clean_customer_data(data: Dict[str, Any]) -> Dict[str, Any]:
     
     # Required fields
     if 'email' in data:
-        email = str(data['email']).strip().lower()
+        email = normalize_email(str(data['email']))
         if validate_email(email):
             cleaned['email'] = email
         else:
@@ -95,11 +110,49 @@ def clean_customer_data(data: Dict[str, Any]) -> Dict[str, Any]:
     return cleaned
 
 
+def validate_customer_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Clean and validate a whole chunk of customer rows at once.
+
+    Works column by column with vectorized string operations instead of
+    calling clean_customer_data per row. Invalid phones are dropped like in
+    the per-row path, rejected rows keep their data for reporting.
+
+    Returns:
+        DataFrame with the customer columns plus a rejection_reason column
+        that is NA for valid rows
+    """
+    df = df.reindex(columns=CUSTOMER_COLUMNS)
+    for column in CUSTOMER_COLUMNS:
+        values = df[column].astype("string").str.strip()
+        df[column] = values.mask(values == "")
+
+    df['email'] = df['email'].str.lower()
+    df['language'] = df['language'].fillna('vi')
+
+    phone = df['phone'].str.replace(PHONE_SEPARATORS_PATTERN, '', regex=True)
+    df['phone'] = phone.where(phone.str.fullmatch(PHONE_PATTERN).fillna(False).astype(bool))
+
+    # Normalize separators first so a single split yields clean tag lists
+    tags = df['tags'].str.replace(TAG_SEPARATOR_PATTERN, ',', regex=True).str.strip(', ')
+    tags = tags.mask(tags == "").str.split(',')
+    df['tags'] = pd.Series([value if isinstance(value, list) else [] for value in tags], index=df.index, dtype=object)
+
+    # Later checks overwrite earlier ones, so the most basic problem wins
+    reason = pd.Series(pd.NA, index=df.index, dtype="string")
+    reason = reason.mask(df['email'].duplicated() & df['email'].notna(), "duplicate_email")
+    reason = reason.mask(~df['email'].str.fullmatch(EMAIL_PATTERN).fillna(True).astype(bool), "invalid_email")
+    reason = reason.mask(df['full_name'].isna(), "missing_full_name")
+    reason = reason.mask(df['email'].isna(), "missing_email")
+    df[REJECTION_REASON_COLUMN] = reason
+    return df
+
+
 def validate_notification_template(template: str, data: Dict[str, Any]) -> bool:
     """Validate notification template with provided data."""
     try:
-        # Try to format template with data
-        template.format(**data)
+        # Try to render template with data
+        compile_template(template).render(data)
         return True
     except KeyError as e:
         # Missing required variable
@@ -119,4 +172,4 @@ def extract_template_variables(template: str) -> List[str]:
         if field_name is not None:
             variables.append(field_name)
     
-    return list(set(variables))  # Remove duplicates 
\ No newline at end of file
+    return list(set(variables))  # Remove duplicates
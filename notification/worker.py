@@ -9,25 +9,46 @@ import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from taskiq_redis import RedisStreamBroker, RedisAsyncResultBackend
-from taskiq import TaskiqEvents
+from taskiq import TaskiqEvents, TaskiqScheduler
+from taskiq.schedule_sources import LabelScheduleSource
 
 from config.settings import settings
-from config.database import connect_to_mongo, close_mongo_connection
+from config.database import (
+    connect_to_mongo,
+    close_mongo_connection,
+    connect_to_redis,
+    close_redis_connection
+)
+from config.indexes import bootstrap_indexes
 
 broker = RedisStreamBroker(url=settings.taskiq_broker_url)
 broker = broker.with_result_backend(
     RedisAsyncResultBackend(redis_url=settings.taskiq_broker_url)
 )
 
+# Scheduler for periodic tasks declared with schedule labels (run: taskiq scheduler worker:scheduler)
+scheduler = TaskiqScheduler(broker, sources=[LabelScheduleSource(broker)])
+
 @broker.on_event(TaskiqEvents.WORKER_STARTUP)
 async def worker_startup(state):
     await connect_to_mongo()
     print("[WORKER] MongoDB connected.")
+    try:
+        await bootstrap_indexes()
+    except Exception as e:
+        print(f"[WORKER] Index bootstrap skipped: {str(e)}")
+    await connect_to_redis()
+    print("[WORKER] Redis connected.")
 
 @broker.on_event(TaskiqEvents.WORKER_SHUTDOWN)
 async def worker_shutdown(state):
+    from tasks.import_customers import shutdown_parse_pool
+    await shutdown_parse_pool()
     await close_mongo_connection()
     print("[WORKER] MongoDB disconnected.")
+    await close_redis_connection()
+    print("[WORKER] Redis disconnected.")
 
 import tasks.import_customers
 import tasks.send_notification
+import tasks.reports